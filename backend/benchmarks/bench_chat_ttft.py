@@ -0,0 +1,55 @@
+"""
+Time-to-first-token for the blocking and streaming chat paths, measured
+against the local stub completions server.
+
+    python benchmarks/bench_chat_ttft.py --ttft-ms 600 --token-ms 40
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from openai import OpenAI
+from chat_completion import complete, stream_completion
+from stub_openai import start_stub
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--ttft-ms", type=int, default=600)
+    parser.add_argument("--token-ms", type=int, default=40)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    server, _ = start_stub(ttft_ms=args.ttft_ms, token_ms=args.token_ms)
+    client = OpenAI(api_key="stub", base_url=f"http://127.0.0.1:{server.server_port}/v1")
+    question = "What does a robin eat?"
+
+    blocking, first_token, streamed_total = [], [], []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        reply = complete(client, question)
+        blocking.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        parts = []
+        for token in stream_completion(client, question):
+            if not parts:
+                first_token.append(time.perf_counter() - start)
+            parts.append(token)
+        streamed_total.append(time.perf_counter() - start)
+        assert "".join(parts) == reply
+
+    ms = lambda values: statistics.median(values) * 1000
+    print(f"blocking reply (first text visible): {ms(blocking):8.1f} ms")
+    print(f"streaming first token:               {ms(first_token):8.1f} ms")
+    print(f"streaming full reply:                {ms(streamed_total):8.1f} ms")
+    print(f"time-to-first-token reduction:       {(1 - ms(first_token) / ms(blocking)) * 100:8.1f} %")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
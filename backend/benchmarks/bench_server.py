@@ -0,0 +1,483 @@
+"""
+Load test for the main server routes with no network access.
+
+Firestore is replaced by the in-memory fake in fake_firestore.py, OpenAI by
+the local stub completions server, and audubon.org by a saved page served
+from localhost. BirdNET runs for real when birdnetlib is installed and is
+otherwise replaced by a fixed-delay stand-in; the report records which.
+
+    python benchmarks/bench_server.py --out benchmarks/results/$(git rev-parse --short HEAD).json
+    python benchmarks/bench_server.py --compare benchmarks/results/<older>.json
+"""
+import io
+import os
+import sys
+import json
+import time
+import types
+import queue
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.abspath(os.path.join(BENCH_DIR, "..", "src"))
+sys.path.insert(0, SRC_DIR)
+
+from fake_firestore import FakeFirestore
+from stub_openai import start_stub
+
+BIRDS = ["American Robin", "Blue Jay", "Northern Cardinal", "Mourning Dove", "Canada Goose"]
+FORECAST_BIRD = "robin"
+EMAIL = "bench@example.com"
+PASSWORD = "bench-password"
+RATE = 44100
+
+
+def install_fake_birdnet(inference_ms):
+    """Stand in for birdnetlib when it isn't installed: a fixed delay and one fixed detection."""
+    birdnetlib = types.ModuleType("birdnetlib")
+    analyzer_module = types.ModuleType("birdnetlib.analyzer")
+
+    class Analyzer:
+        verbose = False
+
+    class Recording:
+        def __init__(self, analyzer, path, lat=None, lon=None, date=None, min_conf=0.25):
+            self.path = path
+            self.detections = []
+
+        def analyze(self):
+            time.sleep(inference_ms / 1000)
+            self.detections = [
+                {"common_name": "American Robin", "confidence": 0.91, "start_time": 0.0, "end_time": 3.0}
+            ]
+
+    birdnetlib.Recording = Recording
+    birdnetlib.analyzer = analyzer_module
+    analyzer_module.Analyzer = Analyzer
+    sys.modules["birdnetlib"] = birdnetlib
+    sys.modules["birdnetlib.analyzer"] = analyzer_module
+
+
+def synth_song(seconds, song_seconds=None, period=None, seed=0):
+    """
+    16-bit mono audio: quiet background noise with a warbling 3 kHz tone,
+    loud enough to pass both noise gates. With `period`, the tone plays for
+    the first `song_seconds` of every `period` seconds.
+    """
+    t = np.arange(int(seconds * RATE)) / RATE
+    rng = np.random.default_rng(seed)
+    signal = rng.normal(0, 50, t.size)
+    tone = 8000 * np.sin(2 * np.pi * (3000 * t + 50 * np.sin(2 * np.pi * 8 * t)))
+    if period:
+        tone *= (t % period) < song_seconds
+    signal += tone
+    return np.clip(signal, -32768, 32767).astype(np.int16)
+
+
+def encode_m4a(samples):
+    """AAC-in-MP4 bytes, as the app uploads; needs ffmpeg."""
+    from pydub import AudioSegment
+
+    segment = AudioSegment(samples.tobytes(), sample_width=2, frame_rate=RATE, channels=1)
+    buffer = io.BytesIO()
+    segment.export(buffer, format="ipod")
+    return buffer.getvalue()
+
+
+def serve_audubon_fixture(page_kb):
+    """Serve the saved Audubon page on localhost, padded out to roughly `page_kb` like the live page."""
+    with open(os.path.join(BENCH_DIR, "fixtures", "audubon_american_robin.html"), "r", encoding="utf-8") as f:
+        page = f.read()
+    item = '<li class="menu-item"><a href="/birds">Birds</a><ul><li><a href="/field-guide">Field Guide</a></li></ul></li>'
+    padding = item * max(0, page_kb * 1024 // len(item))
+    page = page.replace("<!--NAV-->", padding[:len(padding) // 2]).replace("<!--FOOTER-->", padding[len(padding) // 2:])
+    body = page.encode("utf-8")
+
+    class Handler(SimpleHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/field-guide/bird/american-robin"
+
+
+def import_server(db, openai_url, workdir):
+    """Import server.py against the fake Firestore and stub services."""
+    os.environ.update({
+        "FIREBASE_ADMIN_CREDENTIALS": os.path.abspath(__file__),
+        "FLASK_SECRET_KEY": "bench",
+        "OPENAI_API_KEY": "stub",
+        "OPENAI_BASE_URL": openai_url,
+        "BIRDNET_WARMUP": "off",
+        "DETECTION_SERVICE_SPAWN": "0",
+        "CHAT_CACHE_PREWARM": "",
+    })
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
+    credentials.Certificate = lambda path: None
+    firebase_admin.initialize_app = lambda *args, **kwargs: None
+    firestore.client = lambda *args, **kwargs: db
+
+    # The upload route's temporary audio goes here
+    os.chdir(workdir)
+    import server
+    return server
+
+
+def seed(db, detections, hotspots, messages):
+    """A user with a detection history, a chat, and forecasts for every month."""
+    import bcrypt
+    from detection_summaries import record_detections
+    from chat_store import add_exchange
+
+    _, user_ref = db.collection("users").add({
+        "firstName": "Bench",
+        "lastName": "User",
+        "email": EMAIL,
+        "password": bcrypt.hashpw(PASSWORD.encode(), bcrypt.gensalt(rounds=4)).decode(),
+    })
+    user_id = user_ref.id
+
+    rng = np.random.default_rng(1)
+    now = datetime.now(timezone.utc)
+    records = [{
+        "bird": BIRDS[i % len(BIRDS)],
+        "latitude": 42.3 + rng.normal(0, 0.5),
+        "longitude": -83.0 + rng.normal(0, 0.5),
+        "timestamp": now - timedelta(minutes=int(rng.integers(0, 365 * 24 * 60))),
+        "userId": user_id,
+    } for i in range(detections)]
+    for start in range(0, len(records), 200):
+        record_detections(db, user_id, records[start:start + 200])
+
+    for month in range(1, 13):
+        lats = 25 + rng.random(hotspots) * 24
+        lons = -124 + rng.random(hotspots) * 57
+        db.collection("forecasts").document(FORECAST_BIRD).collection("topHotspots").document(str(month)).set({
+            "topHotspots": [{
+                "location": f"{lat:.4f}, {lon:.4f}",
+                "lat": float(lat),
+                "lon": float(lon),
+                "reliability_score": float(score),
+            } for lat, lon, score in zip(lats, lons, rng.random(hotspots))]
+        })
+
+    _, chat_ref = db.collection("chats").add({"userId": user_id, "title": "Bench chat"})
+    for i in range(messages // 2):
+        add_exchange(db, chat_ref.id, user_id, f"Seed question {i}?", f"Seed answer {i}.")
+    return user_id, chat_ref.id
+
+
+def logged_in_client(app):
+    client = app.test_client()
+    response = client.post("/login", json={"email": EMAIL, "password": PASSWORD})
+    if response.status_code != 200:
+        raise RuntimeError(f"Login failed: {response.get_json()}")
+    return client
+
+
+def percentile(values, q):
+    return round(float(np.percentile(values, q)) * 1000, 2) if values else None
+
+
+def run_scenario(clients, request_fn, requests, concurrency, warmup, db):
+    """Send `requests` requests from `concurrency` threads, each with its own logged-in client."""
+    for i in range(warmup):
+        request_fn(clients[0], -1 - i).get_data()
+
+    pool = queue.Queue()
+    for client in clients[:concurrency]:
+        pool.put(client)
+    local = threading.local()
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def one(i):
+        if not hasattr(local, "client"):
+            local.client = pool.get()
+        start = time.perf_counter()
+        response = request_fn(local.client, i)
+        response.get_data()
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if response.status_code >= 400:
+                errors.append(response.status_code)
+
+    before = db.stats()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(requests)))
+    wall = time.perf_counter() - started
+    after = db.stats()
+
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": len(errors),
+        "throughput_rps": round(requests / wall, 2),
+        "p50_ms": percentile(latencies, 50),
+        "p99_ms": percentile(latencies, 99),
+        "mean_ms": round(float(np.mean(latencies)) * 1000, 2),
+        "firestore_rpcs_per_request": round((after["rpcs"] - before["rpcs"]) / requests, 2),
+        "firestore_reads_per_request": round((after["reads"] - before["reads"]) / requests, 2),
+    }
+
+
+class StreamResult:
+    """Stands in for a response whose body was already read, so run_scenario can time streams too."""
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+    def get_data(self):
+        return b""
+
+
+def stream_delivery(client, db, user_id, i):
+    """
+    Open /my-birds/stream, write a detection the way the detection service
+    would, and read until that detection arrives on the stream.
+    """
+    response = client.get("/my-birds/stream", buffered=False)
+    if response.status_code != 200:
+        return response
+    chunks = response.iter_encoded()
+    try:
+        # The retry line is sent once the subscription is open
+        next(chunks)
+        _, ref = db.collection("birds").add({
+            "bird": BIRDS[i % len(BIRDS)],
+            "latitude": 42.3,
+            "longitude": -83.0,
+            "timestamp": datetime.now(timezone.utc),
+            "count": 1,
+            "maxConfidence": 0.9,
+            "userId": user_id,
+        })
+        for chunk in chunks:
+            if f"id: {ref.id}".encode() in chunk:
+                return StreamResult(200)
+        return StreamResult(599)
+    finally:
+        response.close()
+
+
+def run_detector_replay(db, user_id, songs):
+    """Replay recorded audio through BirdDetector as fast as it can be processed."""
+    from detect_birds import BirdDetector, CHUNK
+    from warmup import get_analyzer
+
+    segment_times = []
+
+    class TimedDetector(BirdDetector):
+        def save_and_analyze(self, full_data, offset=0.0):
+            start = time.perf_counter()
+            super().save_and_analyze(full_data, offset)
+            segment_times.append(time.perf_counter() - start)
+
+    # 10 s of background noise for calibration, then `songs` phrases of 4 s song and 8 s quiet
+    quiet = synth_song(10, song_seconds=0, period=1, seed=2)
+    song = synth_song(12 * songs, song_seconds=4, period=12, seed=3)
+    audio = np.concatenate([quiet, song])
+    chunks = [audio[i:i + CHUNK].tobytes() for i in range(0, len(audio) - CHUNK + 1, CHUNK)]
+
+    detector = TimedDetector(db, get_analyzer(), user_id=user_id, location=[42.3, -83.0])
+    before = db.stats()
+    started = time.perf_counter()
+    detector.replay(iter(chunks))
+    wall = time.perf_counter() - started
+    stats = detector.snapshot_stats()
+
+    audio_seconds = len(chunks) * CHUNK / RATE
+    return {
+        "chunks": stats["chunks_read"],
+        "segments": stats["segments_analyzed"],
+        "detections": stats["detections"],
+        "records_created": stats["records_created"],
+        "records_updated": stats["records_updated"],
+        "chunks_per_second": round(stats["chunks_read"] / wall, 1),
+        "realtime_factor": round(audio_seconds / wall, 1),
+        "segment_p50_ms": percentile(segment_times, 50),
+        "segment_p99_ms": percentile(segment_times, 99),
+        "firestore_rpcs": db.stats()["rpcs"] - before["rpcs"],
+    }
+
+
+def git_commit():
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, text=True).strip()
+        dirty = subprocess.check_output(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=BENCH_DIR, text=True
+        ).strip()
+        return f"{commit}-dirty" if dirty else commit
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_report(report, baseline=None):
+    print(f"commit {report['commit']}  birdnet={report['config']['birdnet']}  "
+          f"firestore latency={report['config']['firestore_latency_ms']} ms")
+    header = f"{'scenario':<18}{'rps':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}{'fs rpc/req':>12}"
+    print(header)
+    for name, result in report["scenarios"].items():
+        if "skipped" in result:
+            print(f"{name:<18}  skipped: {result['skipped']}")
+            continue
+        line = (f"{name:<18}{result['throughput_rps']:>10}{result['p50_ms']:>10}{result['p99_ms']:>10}"
+                f"{result['errors']:>8}{result['firestore_rpcs_per_request']:>12}")
+        old = (baseline or {}).get("scenarios", {}).get(name)
+        if old and "skipped" not in old:
+            change = lambda new, prev: f"{(new - prev) / prev * 100:+.0f}%" if prev else "n/a"
+            line += (f"   vs {baseline['commit']}: rps {change(result['throughput_rps'], old['throughput_rps'])}, "
+                     f"p50 {change(result['p50_ms'], old['p50_ms'])}, p99 {change(result['p99_ms'], old['p99_ms'])}")
+        print(line)
+
+    replay = report.get("detector_replay")
+    if replay:
+        print(f"{'detector_replay':<18}{replay['chunks_per_second']:>10} chunks/s  "
+              f"{replay['realtime_factor']}x realtime  segment p50 {replay['segment_p50_ms']} ms, "
+              f"p99 {replay['segment_p99_ms']} ms, {replay['detections']} detections -> "
+              f"{replay['records_created']} records, {replay['firestore_rpcs']} Firestore calls")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--only", nargs="*", help="scenarios to run")
+    parser.add_argument("--detections", type=int, default=2000, help="seeded detection history")
+    parser.add_argument("--hotspots", type=int, default=1000, help="hotspots per forecast month")
+    parser.add_argument("--messages", type=int, default=200, help="seeded chat messages")
+    parser.add_argument("--firestore-latency-ms", type=float, default=0)
+    parser.add_argument("--ttft-ms", type=int, default=300)
+    parser.add_argument("--token-ms", type=int, default=10)
+    parser.add_argument("--inference-ms", type=int, default=250, help="stand-in BirdNET delay")
+    parser.add_argument("--fake-birdnet", action="store_true", help="use the stand-in even if birdnetlib is installed")
+    parser.add_argument("--audubon-page-kb", type=int, default=150)
+    parser.add_argument("--replay-songs", type=int, default=10, help="song phrases in the detector replay")
+    parser.add_argument("--out", help="write the JSON report here")
+    parser.add_argument("--compare", help="earlier JSON report to compare against")
+    parser.add_argument("--verbose", action="store_true", help="show the server's own output")
+    args = parser.parse_args()
+
+    birdnet = "real"
+    try:
+        if args.fake_birdnet:
+            raise ImportError
+        import birdnetlib  # noqa: F401
+    except ImportError:
+        install_fake_birdnet(args.inference_ms)
+        birdnet = f"stand-in ({args.inference_ms} ms)"
+
+    # The server prints on every login and scrape; keep that out of the report unless asked for
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+    with quiet:
+        report = run_benchmarks(args, birdnet)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+def run_benchmarks(args, birdnet):
+    stub, _ = start_stub(ttft_ms=args.ttft_ms, token_ms=args.token_ms)
+    audubon, audubon_url = serve_audubon_fixture(args.audubon_page_kb)
+    db = FakeFirestore(latency_ms=args.firestore_latency_ms)
+    workdir = tempfile.mkdtemp(prefix="robin-bench-")
+    server = import_server(db, f"http://127.0.0.1:{stub.server_port}/v1", workdir)
+    user_id, chat_id = seed(db, args.detections, args.hotspots, args.messages)
+
+    app = server.app
+    clients = [logged_in_client(app) for _ in range(args.concurrency)]
+    samples = synth_song(6)
+
+    scenarios = {
+        "my_birds": lambda c, i: c.get("/my-birds"),
+        "get_hotspot": lambda c, i: c.get(f"/get-hotspot?bird={FORECAST_BIRD}&month={i % 12 + 1}&lat=42.3&lon=-83.0&k=5"),
+        "scrape_bird_info": lambda c, i: c.get("/scrape-bird-info", query_string={"url": audubon_url}),
+        "chat_message": lambda c, i: c.post(f"/chats/{chat_id}/message", json={"message": f"What do robins eat? ({i})"}),
+        "chat_stream": lambda c, i: c.post(f"/chats/{chat_id}/message/stream", json={"message": f"Where do robins nest? ({i})"}),
+        "chat_messages": lambda c, i: c.get(f"/chats/{chat_id}/messages?limit=50"),
+        "nearby": lambda c, i: c.get("/nearby?lat=42.3&lon=-83.0&radius=20"),
+        "my_birds_stream": lambda c, i: stream_delivery(c, db, user_id, i),
+        "upload": None,
+    }
+    selected = args.only or list(scenarios) + ["detector_replay"]
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "detections": args.detections,
+            "hotspots": args.hotspots,
+            "messages": args.messages,
+            "firestore_latency_ms": args.firestore_latency_ms,
+            "ttft_ms": args.ttft_ms,
+            "token_ms": args.token_ms,
+            "birdnet": birdnet,
+        },
+        "scenarios": {},
+    }
+
+    for name, request_fn in scenarios.items():
+        if name not in selected:
+            continue
+        concurrency = args.concurrency
+        if name == "my_birds_stream":
+            # Every client is the same user, and opening more streams than this closes the oldest
+            concurrency = min(concurrency, server.detection_events.max_per_user)
+        if name == "upload":
+            if shutil.which("ffmpeg") is None:
+                report["scenarios"][name] = {"skipped": "ffmpeg not found"}
+                continue
+            m4a = encode_m4a(samples)
+            request_fn = lambda c, i: c.post("/upload", data={
+                "file": (io.BytesIO(m4a), "recording.m4a"), "latitude": "42.3", "longitude": "-83.0"
+            }, content_type="multipart/form-data")
+            # The route converts through fixed temp file names, so uploads can't overlap
+            concurrency = 1
+        report["scenarios"][name] = run_scenario(clients, request_fn, args.requests, concurrency, args.warmup, db)
+
+    if "detector_replay" in selected:
+        report["detector_replay"] = run_detector_replay(db, user_id, args.replay_songs)
+
+    stub.shutdown()
+    audubon.shutdown()
+    shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+
+if __name__ == "__main__":
+    main()
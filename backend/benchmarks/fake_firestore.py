@@ -0,0 +1,403 @@
+"""
+In-memory stand-in for the parts of the Firestore client the server uses:
+documents and subcollections, where/order_by/limit/start_after/select
+queries, batches, transactions, snapshot listeners, SERVER_TIMESTAMP and
+Increment. It counts RPCs and document reads so benchmarks can report
+Firestore cost per request, and can add a fixed latency per RPC to
+approximate a real round trip. Listener traffic isn't counted, since it
+arrives in the background rather than as part of a request.
+"""
+import copy
+import enum
+import time
+import uuid
+import queue
+import threading
+from datetime import datetime, timezone
+from google.cloud.firestore_v1 import transforms
+from google.cloud.firestore_v1.field_path import FieldPath
+
+DOCUMENT_ID = FieldPath.document_id()
+
+_OPERATORS = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+    "in": lambda a, b: a in b,
+    "not-in": lambda a, b: a not in b,
+    "array_contains": lambda a, b: isinstance(a, list) and b in a,
+}
+
+_MISSING = object()
+
+ChangeType = enum.Enum("ChangeType", ["ADDED", "MODIFIED", "REMOVED"])
+
+
+def _get_field(data, doc_id, field):
+    if field == DOCUMENT_ID:
+        return doc_id
+    value = data
+    for part in field.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _resolve(value, current=_MISSING):
+    """Apply SERVER_TIMESTAMP and Increment the way the server would."""
+    if value is transforms.SERVER_TIMESTAMP:
+        return datetime.now(timezone.utc)
+    if isinstance(value, transforms.Increment):
+        return (current if isinstance(current, (int, float)) else 0) + value.value
+    if isinstance(value, dict):
+        existing = current if isinstance(current, dict) else {}
+        return {k: _resolve(v, existing.get(k, _MISSING)) for k, v in value.items()}
+    return copy.deepcopy(value)
+
+
+class FakeFirestore:
+    def __init__(self, latency_ms=0):
+        self.latency = latency_ms / 1000
+        # collection path -> {doc id: data}
+        self._collections = {}
+        self._lock = threading.RLock()
+        self._transaction_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._watches = []
+        self.rpcs = 0
+        self.reads = 0
+        self.writes = 0
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def transaction(self, **kwargs):
+        return FakeTransaction(self)
+
+    def stats(self):
+        with self._stats_lock:
+            return {"rpcs": self.rpcs, "reads": self.reads, "writes": self.writes}
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        self._rpc(reads=max(len(references), 1))
+        for ref in references:
+            yield FakeSnapshot(ref, self._read(ref._collection_path, ref.id))
+
+    def _rpc(self, reads=0, writes=0):
+        with self._stats_lock:
+            self.rpcs += 1
+            self.reads += reads
+            self.writes += writes
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _read(self, collection_path, doc_id):
+        with self._lock:
+            data = self._collections.get(collection_path, {}).get(doc_id)
+            return copy.deepcopy(data)
+
+    def _apply(self, op, ref, data=None, merge=False):
+        with self._lock:
+            docs = self._collections.setdefault(ref._collection_path, {})
+            watches = [watch for watch in self._watches if watch.query._collection_path == ref._collection_path]
+            before = copy.deepcopy(docs.get(ref.id)) if watches else None
+            self._write(op, ref, docs, data, merge)
+            # Under the lock, so each listener sees writes in the order they were made
+            for watch in watches:
+                watch.changed(ref, before, copy.deepcopy(docs.get(ref.id)))
+
+    def _write(self, op, ref, docs, data, merge):
+        if op == "delete":
+            docs.pop(ref.id, None)
+        elif op == "set" and not merge:
+            docs[ref.id] = _resolve(data)
+        elif op == "set":
+            docs[ref.id] = {**docs.get(ref.id, {}), **_resolve(data, docs.get(ref.id, {}))}
+        elif op == "update":
+            if ref.id not in docs:
+                raise ValueError(f"No document to update: {ref.path}")
+            current = docs[ref.id]
+            for field, value in data.items():
+                parts = field.split(".")
+                target = current
+                for part in parts[:-1]:
+                    target = target.setdefault(part, {})
+                target[parts[-1]] = _resolve(value, target.get(parts[-1], _MISSING))
+
+    def _scan(self, collection_path):
+        with self._lock:
+            return [(doc_id, copy.deepcopy(data)) for doc_id, data in self._collections.get(collection_path, {}).items()]
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data)
+
+    def get(self, field):
+        value = _get_field(self._data or {}, self.id, field)
+        if value is _MISSING:
+            raise KeyError(field)
+        return value
+
+
+class FakeDocumentReference:
+    def __init__(self, client, collection_path, doc_id):
+        self._client = client
+        self._collection_path = collection_path
+        self.id = doc_id
+        self.path = f"{collection_path}/{doc_id}"
+
+    def collection(self, name):
+        return FakeCollection(self._client, f"{self.path}/{name}")
+
+    def get(self, field_paths=None, transaction=None, **kwargs):
+        self._client._rpc(reads=1)
+        return FakeSnapshot(self, self._client._read(self._collection_path, self.id))
+
+    def set(self, document_data, merge=False):
+        self._client._rpc(writes=1)
+        self._client._apply("set", self, document_data, merge)
+
+    def update(self, field_updates):
+        self._client._rpc(writes=1)
+        self._client._apply("update", self, field_updates)
+
+    def delete(self):
+        self._client._rpc(writes=1)
+        self._client._apply("delete", self)
+
+    def on_snapshot(self, callback):
+        raise NotImplementedError("Document listeners aren't supported by the fake, only query listeners")
+
+
+class FakeQuery:
+    def __init__(self, client, collection_path, filters=(), orders=(), limit_count=None, cursor=None):
+        self._client = client
+        self._collection_path = collection_path
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit_count
+        self._cursor = cursor
+
+    def _copy(self, **changes):
+        state = {
+            "filters": self._filters, "orders": self._orders,
+            "limit_count": self._limit, "cursor": self._cursor,
+        }
+        state.update(changes)
+        return FakeQuery(self._client, self._collection_path, **state)
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction="ASCENDING"):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count):
+        return self._copy(limit_count=count)
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copy(cursor=document_fields_or_snapshot)
+
+    def select(self, field_paths):
+        return self
+
+    def _order_key(self, doc_id, data):
+        return [_get_field(data, doc_id, field) for field, _ in self._orders]
+
+    def _sort(self, docs):
+        # Python's sort is stable, so sorting by each ordering from last to first gives the combined order
+        docs = sorted(docs, key=lambda doc: doc[0])
+        for index in reversed(range(len(self._orders))):
+            descending = self._orders[index][1] == "DESCENDING"
+            docs.sort(key=lambda doc: self._order_key(*doc)[index], reverse=descending)
+        return docs
+
+    def _after_cursor(self, docs):
+        cursor_key = self._order_key(self._cursor.id, self._cursor.to_dict() or {}) + [self._cursor.id]
+        for position, (doc_id, data) in enumerate(docs):
+            if self._order_key(doc_id, data) + [doc_id] == cursor_key:
+                return docs[position + 1:]
+        return docs
+
+    def _matches(self, doc_id, data):
+        if data is None:
+            return False
+        for field, op, value in self._filters:
+            current = _get_field(data, doc_id, field)
+            if current is _MISSING or not _OPERATORS[op](current, value):
+                return False
+        # Firestore leaves out documents that don't have an ordered-by field
+        return all(_get_field(data, doc_id, field) is not _MISSING for field, _ in self._orders)
+
+    def stream(self, transaction=None, **kwargs):
+        docs = [(doc_id, data) for doc_id, data in self._client._scan(self._collection_path) if self._matches(doc_id, data)]
+        docs = self._sort(docs)
+        if self._cursor is not None:
+            docs = self._after_cursor(docs)
+        if self._limit is not None:
+            docs = docs[:self._limit]
+
+        self._client._rpc(reads=max(len(docs), 1))
+        for doc_id, data in docs:
+            yield FakeSnapshot(FakeDocumentReference(self._client, self._collection_path, doc_id), data)
+
+    def get(self, transaction=None, **kwargs):
+        return list(self.stream(transaction=transaction))
+
+    def on_snapshot(self, callback):
+        return FakeWatch(self, callback)
+
+
+class FakeChange:
+    def __init__(self, type, document):
+        self.type = type
+        self.document = document
+
+
+class FakeWatch:
+    """
+    A query listener: calls `callback(docs, changes, read_time)` on its own
+    thread, first with every matching document as ADDED and then once per
+    write that moves a document into, within or out of the query. Ordering
+    and limits aren't applied to listener results.
+    """
+
+    def __init__(self, query, callback):
+        self.query = query
+        self._callback = callback
+        self._pending = queue.Queue()
+        self._docs = {}
+        client = query._client
+        with client._lock:
+            initial = [
+                (doc_id, copy.deepcopy(data)) for doc_id, data in client._collections.get(query._collection_path, {}).items()
+                if query._matches(doc_id, data)
+            ]
+            client._watches.append(self)
+        self._pending.put([(ChangeType.ADDED, doc_id, data) for doc_id, data in initial])
+        self._thread = threading.Thread(target=self._deliver, name="fake-firestore-watch", daemon=True)
+        self._thread.start()
+
+    def changed(self, ref, before, after):
+        was_in = self.query._matches(ref.id, before)
+        is_in = self.query._matches(ref.id, after)
+        if is_in:
+            self._pending.put([(ChangeType.MODIFIED if was_in else ChangeType.ADDED, ref.id, after)])
+        elif was_in:
+            self._pending.put([(ChangeType.REMOVED, ref.id, before)])
+
+    def _deliver(self):
+        while True:
+            batch = self._pending.get()
+            if batch is None:
+                return
+            changes = []
+            for change_type, doc_id, data in batch:
+                if change_type == ChangeType.REMOVED:
+                    self._docs.pop(doc_id, None)
+                else:
+                    self._docs[doc_id] = data
+                ref = FakeDocumentReference(self.query._client, self.query._collection_path, doc_id)
+                changes.append(FakeChange(change_type, FakeSnapshot(ref, data)))
+            docs = [
+                FakeSnapshot(FakeDocumentReference(self.query._client, self.query._collection_path, doc_id), data)
+                for doc_id, data in self._docs.items()
+            ]
+            try:
+                self._callback(docs, changes, datetime.now(timezone.utc))
+            except Exception as e:
+                print(f"Fake listener callback failed: {str(e)}")
+
+    def unsubscribe(self):
+        client = self.query._client
+        with client._lock:
+            if self in client._watches:
+                client._watches.remove(self)
+        self._pending.put(None)
+
+
+class FakeCollection(FakeQuery):
+    def __init__(self, client, path):
+        super().__init__(client, path)
+        self.id = path.rsplit("/", 1)[-1]
+
+    def document(self, document_id=None):
+        return FakeDocumentReference(self._client, self._collection_path, document_id or uuid.uuid4().hex[:20])
+
+    def add(self, document_data, document_id=None):
+        ref = self.document(document_id)
+        ref.set(document_data)
+        return datetime.now(timezone.utc), ref
+
+
+class FakeWriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def set(self, reference, document_data, merge=False):
+        self._writes.append(("set", reference, document_data, merge))
+
+    def update(self, reference, field_updates):
+        self._writes.append(("update", reference, field_updates, False))
+
+    def delete(self, reference):
+        self._writes.append(("delete", reference, None, False))
+
+    def commit(self):
+        self._client._rpc(writes=len(self._writes))
+        with self._client._lock:
+            for op, reference, data, merge in self._writes:
+                self._client._apply(op, reference, data, merge)
+        self._writes = []
+
+
+class FakeTransaction(FakeWriteBatch):
+    """Works with @firestore.transactional. Transactions run one at a time, so they never conflict."""
+
+    _read_only = False
+    _max_attempts = 1
+
+    def __init__(self, client):
+        super().__init__(client)
+        self._id = None
+
+    def _clean_up(self):
+        self._writes = []
+        self._id = None
+
+    def _begin(self, retry_id=None):
+        self._client._transaction_lock.acquire()
+        self._id = uuid.uuid4().bytes
+
+    def _commit(self):
+        try:
+            self.commit()
+        finally:
+            self._id = None
+            self._client._transaction_lock.release()
+
+    def _rollback(self):
+        if self._id is not None:
+            self._id = None
+            self._client._transaction_lock.release()
+        self._writes = []
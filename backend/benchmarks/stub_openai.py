@@ -0,0 +1,114 @@
+"""
+Local stand-in for the OpenAI chat-completions API with configurable
+latency. Point the server at it with OPENAI_BASE_URL=http://127.0.0.1:8089/v1.
+
+    python benchmarks/stub_openai.py --port 8089 --ttft-ms 600 --token-ms 40
+"""
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_REPLY = (
+    "I love plump earthworms, juicy beetles and caterpillars in spring, "
+    "and I switch to berries and fruit when the weather turns cold!"
+)
+
+
+class StubSettings:
+    def __init__(self, ttft_ms=600, token_ms=40, reply=DEFAULT_REPLY):
+        self.ttft = ttft_ms / 1000
+        self.token_delay = token_ms / 1000
+        self.tokens = reply.split(" ")
+        self.requests = 0
+        self.lock = threading.Lock()
+
+
+def make_handler(settings):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self.send_error(404)
+                return
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            with settings.lock:
+                settings.requests += 1
+
+            model = body.get("model", "stub")
+            tokens = [token if i == 0 else " " + token for i, token in enumerate(settings.tokens)]
+            time.sleep(settings.ttft)
+
+            if not body.get("stream"):
+                time.sleep(settings.token_delay * (len(tokens) - 1))
+                payload = json.dumps({
+                    "id": "chatcmpl-stub",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": "".join(tokens)},
+                        "finish_reason": "stop"
+                    }],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)}
+                }).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            for i, token in enumerate(tokens):
+                if i:
+                    time.sleep(settings.token_delay)
+                self._send_chunk(model, {"content": token} if i else {"role": "assistant", "content": token}, None)
+            self._send_chunk(model, {}, "stop")
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+            self.close_connection = True
+
+        def _send_chunk(self, model, delta, finish_reason):
+            chunk = {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+
+    return Handler
+
+
+def start_stub(port=0, **kwargs):
+    """Start the stub on a background thread; returns (server, settings)."""
+    settings = StubSettings(**kwargs)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(settings))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, settings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub OpenAI chat-completions server.")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--ttft-ms", type=int, default=600)
+    parser.add_argument("--token-ms", type=int, default=40)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(StubSettings(args.ttft_ms, args.token_ms)))
+    print(f"Stub completions listening on http://127.0.0.1:{args.port}/v1")
+    server.serve_forever()
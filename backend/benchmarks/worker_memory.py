@@ -0,0 +1,45 @@
+"""
+Per-process memory of a running gunicorn server (master and workers).
+USS is memory only that process owns; PSS splits shared pages between the
+processes sharing them, so the PSS column sums to the real total.
+
+    python benchmarks/worker_memory.py --pid <gunicorn master pid>
+"""
+import argparse
+import psutil
+
+MB = 1024 * 1024
+
+
+def find_master():
+    for proc in psutil.process_iter(["pid", "cmdline"]):
+        cmdline = " ".join(proc.info["cmdline"] or [])
+        if "gunicorn" in cmdline and "server:app" in cmdline:
+            parent = proc.parent()
+            if parent is None or "gunicorn" not in " ".join(parent.cmdline()):
+                return proc
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pid", type=int, help="gunicorn master pid (default: look for server:app)")
+    args = parser.parse_args()
+
+    master = psutil.Process(args.pid) if args.pid else find_master()
+    if master is None:
+        raise SystemExit("No gunicorn server:app master found; pass --pid")
+
+    rows = [("master", master)] + [(f"worker {i}", child) for i, child in enumerate(master.children(), 1)]
+    total_pss = 0
+    print(f"{'process':<10} {'pid':>7} {'rss MB':>9} {'pss MB':>9} {'uss MB':>9}")
+    for name, proc in rows:
+        info = proc.memory_full_info()
+        pss = getattr(info, "pss", 0)
+        total_pss += pss
+        print(f"{name:<10} {proc.pid:>7} {info.rss / MB:>9.1f} {pss / MB:>9.1f} {info.uss / MB:>9.1f}")
+    print(f"{'total':<10} {'':>7} {'':>9} {total_pss / MB:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
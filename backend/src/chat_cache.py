@@ -0,0 +1,76 @@
+import os
+import re
+import threading
+from cachetools import TTLCache
+from chat_completion import PROMPT_VERSION, complete
+
+CHAT_CACHE_SIZE = int(os.getenv("CHAT_CACHE_SIZE", 2048))
+CHAT_CACHE_TTL = int(os.getenv("CHAT_CACHE_TTL", 7 * 24 * 60 * 60))
+
+
+def normalize_question(text):
+    """Lower-case, drop punctuation and collapse whitespace so trivially different phrasings share a key."""
+    text = text.lower().replace("’", "'")
+    text = re.sub(r"[^\w\s]", "", text)
+    return " ".join(text.split())
+
+
+class AnswerCache:
+    """TTL/LRU cache of chat answers keyed on the normalised question and prompt version."""
+
+    def __init__(self, maxsize=CHAT_CACHE_SIZE, ttl=CHAT_CACHE_TTL):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(question):
+        return (PROMPT_VERSION, normalize_question(question))
+
+    def get(self, question):
+        key = self.key(question)
+        with self._lock:
+            answer = self._cache.get(key)
+            if answer is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return answer
+
+    def put(self, question, answer):
+        if not answer:
+            return
+        with self._lock:
+            self._cache[self.key(question)] = answer
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def prewarm(self, client, questions):
+        """Answer any of `questions` not cached yet; returns how many were fetched."""
+        fetched = 0
+        for question in questions:
+            with self._lock:
+                if self.key(question) in self._cache:
+                    continue
+            try:
+                self.put(question, complete(client, question))
+                fetched += 1
+            except Exception as e:
+                print(f"Error prewarming answer for {question!r}: {str(e)}")
+        return fetched
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "promptVersion": PROMPT_VERSION,
+                "size": len(self._cache),
+                "maxsize": self._cache.maxsize,
+                "ttl": self._cache.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,72 @@
+import os
+import json
+import hashlib
+import threading
+from metrics import STAGE_SECONDS
+
+CHAT_MODEL = os.getenv("CHAT_MODEL", "gpt-4")
+MAX_TOKENS = 75
+
+SYSTEM_PROMPT = (
+    "You are a birdwatching assistant answering with enthusiasm! You are roleplaying as the bird the user is asking about. "
+    "Keep your responses strictly 1-2 sentences long. Be concise but informative. "
+    "Do not tell the user that you are roleplaying or that you are pretending to be a bird. "
+    "Answer questions that are only related to birds. "
+    "If a question is outside bird-related topics, respond politely, mentioning that you only answer bird-related questions."
+)
+
+EXAMPLE_MESSAGES = [
+    {"role": "system", "content": SYSTEM_PROMPT},
+    {"role": "user", "content": "Are you a territorial species?"},
+    {"role": "assistant", "content": "Yes, I'm quite territorial! I'll fiercely defend my nesting area and food from other birds or animals who come too close!"},
+    {"role": "user", "content": "What does a Robin eat?"},
+    {"role": "assistant", "content": "My diet is diverse and includes tasty seeds, nuts, insects, and berries—anything nutritious I can find!"}
+]
+
+# Changes whenever the model, prompt or examples change, so cached answers can't outlive them
+PROMPT_VERSION = hashlib.sha1(
+    json.dumps([CHAT_MODEL, MAX_TOKENS, EXAMPLE_MESSAGES], sort_keys=True).encode("utf-8")
+).hexdigest()[:12]
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_openai_client():
+    """The shared OpenAI client, created (and the SDK imported) on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from openai import OpenAI
+                _client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    return _client
+
+
+def build_messages(user_message):
+    return EXAMPLE_MESSAGES + [{"role": "user", "content": user_message}]
+
+
+def complete(client, user_message):
+    """Ask the model for the whole reply in one response."""
+    with STAGE_SECONDS.time("llm_call"):
+        response = client.chat.completions.create(
+            model=CHAT_MODEL,
+            messages=build_messages(user_message),
+            max_tokens=MAX_TOKENS
+        )
+    return response.choices[0].message.content
+
+
+def stream_completion(client, user_message):
+    """Yield the reply's text fragments as the model produces them."""
+    with STAGE_SECONDS.time("llm_call"):
+        stream = client.chat.completions.create(
+            model=CHAT_MODEL,
+            messages=build_messages(user_message),
+            max_tokens=MAX_TOKENS,
+            stream=True
+        )
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
@@ -0,0 +1,216 @@
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from cachetools import TTLCache
+from firebase_admin import firestore
+from google.cloud.firestore_v1.field_path import FieldPath
+
+CHAT_OWNER_CACHE_SIZE = int(os.getenv("CHAT_OWNER_CACHE_SIZE", 10000))
+# Chats never change owner; the TTL only bounds how long another worker's delete goes unnoticed
+CHAT_OWNER_CACHE_TTL = int(os.getenv("CHAT_OWNER_CACHE_TTL", 10 * 60))
+PREVIEW_LENGTH = 200
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+_owners = TTLCache(maxsize=CHAT_OWNER_CACHE_SIZE, ttl=CHAT_OWNER_CACHE_TTL)
+_lock = threading.Lock()
+
+
+def chat_ref(db, chat_id):
+    return db.collection("chats").document(chat_id)
+
+
+def messages_ref(db, chat_id):
+    return chat_ref(db, chat_id).collection("messages")
+
+
+def remember_chat_owner(chat_id, user_id):
+    with _lock:
+        _owners[chat_id] = user_id
+
+
+def forget_chat(chat_id):
+    with _lock:
+        _owners.pop(chat_id, None)
+
+
+def get_chat_owner(db, chat_id):
+    """Owner user id of a chat, or None if it doesn't exist. Only the first lookup reads Firestore."""
+    with _lock:
+        owner = _owners.get(chat_id)
+    if owner is not None:
+        return owner
+
+    chat_doc = chat_ref(db, chat_id).get()
+    if not chat_doc.exists:
+        return None
+    owner = chat_doc.to_dict().get("userId")
+    if owner is not None:
+        remember_chat_owner(chat_id, owner)
+    return owner
+
+
+def add_exchange(db, chat_id, user_id, user_message, bot_message, asked_at=None, partial=False):
+    """
+    Store a user message and the assistant's reply in one batched write,
+    along with the chat's last-message preview. The turns get explicit
+    timestamps so they keep their order even though they are committed
+    together. A `partial` reply (the stream was cut off) is stored with
+    `partial: true`; with no reply at all only the user's turn is stored.
+    """
+    asked_at = asked_at or datetime.now(timezone.utc)
+    answered_at = datetime.now(timezone.utc)
+    if answered_at <= asked_at:
+        answered_at = asked_at + timedelta(microseconds=1)
+
+    messages = messages_ref(db, chat_id)
+    user_ref = messages.document()
+
+    batch = db.batch()
+    batch.set(user_ref, {
+        "content": user_message,
+        "role": "user",
+        "sender": user_id,
+        "timestamp": asked_at
+    })
+    if not bot_message:
+        batch.update(chat_ref(db, chat_id), {
+            "lastMessage": _preview(user_ref.id, user_message, "user", asked_at),
+            "updatedAt": asked_at
+        })
+        batch.commit()
+        return user_ref.id, None
+
+    bot_ref = messages.document()
+    bot_data = {
+        "content": bot_message,
+        "role": "assistant",
+        "sender": "AI",
+        "timestamp": answered_at
+    }
+    if partial:
+        bot_data["partial"] = True
+    batch.set(bot_ref, bot_data)
+    batch.update(chat_ref(db, chat_id), {
+        "lastMessage": _preview(bot_ref.id, bot_message, "assistant", answered_at),
+        "updatedAt": answered_at
+    })
+    batch.commit()
+    return user_ref.id, bot_ref.id
+
+
+def _preview(message_id, content, role, timestamp):
+    return {
+        "messageId": message_id,
+        "content": (content or "")[:PREVIEW_LENGTH],
+        "role": role,
+        "timestamp": timestamp
+    }
+
+
+def _cursor_snapshot(ref):
+    snapshot = ref.get()
+    if not snapshot.exists:
+        raise ValueError("Unknown cursor")
+    return snapshot
+
+
+def page_messages(db, chat_id, limit, before=None, after=None):
+    """
+    One page of a chat's messages in chronological order, plus whether more
+    remain in the direction being read. By default this is the latest
+    `limit` messages; `before` pages back through older ones and `after`
+    fetches only messages newer than the given message id.
+    """
+    messages = messages_ref(db, chat_id)
+    if after:
+        query = messages.order_by("timestamp").start_after(_cursor_snapshot(messages.document(after)))
+        docs = list(query.limit(limit + 1).stream())
+        has_more = len(docs) > limit
+        docs = docs[:limit]
+    else:
+        query = messages.order_by("timestamp", direction=firestore.Query.DESCENDING)
+        if before:
+            query = query.start_after(_cursor_snapshot(messages.document(before)))
+        docs = list(query.limit(limit + 1).stream())
+        has_more = len(docs) > limit
+        docs = docs[:limit][::-1]
+
+    return [{"messageId": msg.id, **msg.to_dict()} for msg in docs], has_more
+
+
+def page_chats(db, user_id, limit, cursor=None):
+    """
+    One page of a user's chats, most recently active first, plus whether more
+    remain. The document id breaks ties so the cursor is stable. Chats without
+    `updatedAt` don't appear; backfill_updated_at() fills it in for old ones.
+    """
+    query = (
+        db.collection("chats")
+          .where("userId", "==", user_id)
+          .order_by("updatedAt", direction=firestore.Query.DESCENDING)
+          .order_by(FieldPath.document_id(), direction=firestore.Query.DESCENDING)
+    )
+    if cursor:
+        query = query.start_after(_cursor_snapshot(chat_ref(db, cursor)))
+    docs = list(query.limit(limit + 1).stream())
+    return [{"chatId": c.id, **c.to_dict()} for c in docs[:limit]], len(docs) > limit
+
+
+def refresh_last_message(db, chat_id, deleted_message_id):
+    """Point the chat's preview at the newest remaining message if the deleted one was shown."""
+    chat = chat_ref(db, chat_id).get()
+    if not chat.exists:
+        return
+    preview = chat.to_dict().get("lastMessage") or {}
+    if preview.get("messageId") != deleted_message_id:
+        return
+
+    latest = list(
+        messages_ref(db, chat_id)
+          .order_by("timestamp", direction=firestore.Query.DESCENDING)
+          .limit(1)
+          .stream()
+    )
+    if latest:
+        data = latest[0].to_dict()
+        preview = _preview(latest[0].id, data.get("content"), data.get("role"), data.get("timestamp"))
+    else:
+        preview = None
+    chat_ref(db, chat_id).update({"lastMessage": preview})
+
+
+def backfill_updated_at(db):
+    """Give chats created before `updatedAt` existed one, from their last message or creation time."""
+    updated = 0
+    batch = db.batch()
+    for chat in db.collection("chats").stream():
+        data = chat.to_dict()
+        if data.get("updatedAt") is not None:
+            continue
+        last = (data.get("lastMessage") or {}).get("timestamp") or data.get("createdAt") or EPOCH
+        batch.update(chat.reference, {"updatedAt": last})
+        updated += 1
+        if updated % 400 == 0:
+            batch.commit()
+            batch = db.batch()
+    batch.commit()
+    return updated
+
+
+if __name__ == "__main__":
+    import argparse
+    import firebase_admin
+    from firebase_admin import credentials
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Chat maintenance.")
+    parser.add_argument("--backfill-updated-at", action="store_true",
+                        help="Set updatedAt on chats that predate it, so they show up in paged chat lists")
+    args = parser.parse_args()
+    if not args.backfill_updated_at:
+        parser.error("nothing to do; pass --backfill-updated-at")
+
+    cred_path = os.getenv("FIREBASE_ADMIN_CREDENTIALS", "backend/secrets/firebase-admin-key.json")
+    firebase_admin.initialize_app(credentials.Certificate(cred_path))
+    print(f"Set updatedAt on {backfill_updated_at(firestore.client())} chats")
@@ -0,0 +1,201 @@
+import os
+import time
+import uuid
+import queue
+import random
+import socket
+import threading
+from datetime import datetime, timedelta, timezone
+from firebase_admin import firestore
+from google.cloud.firestore_v1.field_path import FieldPath
+from detection_summaries import SUMMARY_COLLECTION
+from session_store import SESSION_COLLECTION
+
+JOBS_COLLECTION = "deletionJobs"
+DELETE_BATCH_SIZE = 400
+# A running job whose owner hasn't reported progress for this long is taken over by another worker
+JOB_LEASE_SECONDS = int(os.getenv("DELETION_JOB_LEASE_SECONDS", 5 * 60))
+
+
+class DeletionWorker:
+    """
+    Deletes chats and whole accounts on a background thread using batched
+    deletes, recording progress in deletionJobs/{jobId}. Every server worker
+    runs one; a job is claimed in a transaction before it is processed, so
+    only one worker runs it at a time. Jobs are idempotent, so unfinished
+    ones, and ones whose owner stopped renewing its lease, are picked up
+    again by whichever worker next looks for them.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._queue = queue.Queue()
+        self._queued = set()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the worker thread and resume unfinished jobs. Call after fork, in each worker."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            # The pid changes across fork, so the owner id is taken here rather than at import
+            self.owner = f"{socket.gethostname()}:{os.getpid()}"
+            self._thread = threading.Thread(target=self._run, name="deletion-worker", daemon=True)
+            self._thread.start()
+            threading.Thread(target=self._resume_forever, name="deletion-resume", daemon=True).start()
+
+    def submit(self, kind, target_id, user_id):
+        """Record a deletion job and queue it; returns the job id."""
+        job_id = uuid.uuid4().hex
+        self.db.collection(JOBS_COLLECTION).document(job_id).set({
+            "kind": kind,
+            "targetId": target_id,
+            "userId": user_id,
+            "status": "queued",
+            "deleted": 0,
+            "createdAt": firestore.SERVER_TIMESTAMP
+        })
+        self.start()
+        self._enqueue(job_id)
+        return job_id
+
+    def get_job(self, job_id):
+        snapshot = self.db.collection(JOBS_COLLECTION).document(job_id).get()
+        return snapshot.to_dict() if snapshot.exists else None
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def _enqueue(self, job_id):
+        with self._lock:
+            if job_id in self._queued:
+                return
+            self._queued.add(job_id)
+        self._queue.put(job_id)
+
+    def _resume_forever(self):
+        # Jittered so workers started together don't all scan at once
+        time.sleep(random.uniform(0, 5))
+        while True:
+            self._resume_pending()
+            time.sleep(JOB_LEASE_SECONDS)
+
+    def _resume_pending(self):
+        """Queue jobs nobody is working on: queued ones, and running ones whose lease ran out."""
+        try:
+            now = datetime.now(timezone.utc)
+            pending = (
+                self.db.collection(JOBS_COLLECTION)
+                  .where("status", "in", ["queued", "running"])
+                  .stream()
+            )
+            for job in pending:
+                if _claimable(job.to_dict(), self.owner, now):
+                    self._enqueue(job.id)
+        except Exception as e:
+            print(f"Error resuming deletion jobs: {str(e)}")
+
+    def _run(self):
+        while True:
+            job_id = self._queue.get()
+            try:
+                self._process(job_id)
+            except Exception as e:
+                # Keep the thread alive; the job is retried once its lease runs out
+                print(f"Error processing deletion job {job_id}: {str(e)}")
+            finally:
+                with self._lock:
+                    self._queued.discard(job_id)
+                self._queue.task_done()
+
+    def _claim(self, job_ref):
+        """Take the job for this worker if nobody else holds it; returns its data, or None."""
+
+        @firestore.transactional
+        def claim(transaction):
+            snapshot = job_ref.get(transaction=transaction)
+            if not snapshot.exists:
+                return None
+            job = snapshot.to_dict()
+            if not _claimable(job, self.owner, datetime.now(timezone.utc)):
+                return None
+            transaction.update(job_ref, {
+                "status": "running",
+                "owner": self.owner,
+                "leaseExpiresAt": _lease_expiry(),
+                "startedAt": firestore.SERVER_TIMESTAMP
+            })
+            return job
+
+        return claim(self.db.transaction())
+
+    def _process(self, job_id):
+        job_ref = self.db.collection(JOBS_COLLECTION).document(job_id)
+        job = self._claim(job_ref)
+        if job is None:
+            return
+
+        kind, target_id = job["kind"], job["targetId"]
+        deleted = job.get("deleted", 0)
+
+        def progress(count):
+            nonlocal deleted
+            deleted += count
+            job_ref.update({"deleted": deleted, "leaseExpiresAt": _lease_expiry()})
+
+        try:
+            if kind == "chat":
+                self._purge_chat(target_id, progress)
+            elif kind == "user":
+                self._purge_user(target_id, progress)
+            else:
+                raise ValueError(f"Unknown deletion job kind: {kind}")
+            job_ref.update({"status": "done", "deleted": deleted, "finishedAt": firestore.SERVER_TIMESTAMP})
+        except Exception as e:
+            print(f"Deletion job {job_id} failed: {str(e)}")
+            job_ref.update({"status": "failed", "error": str(e), "deleted": deleted})
+
+    def _delete_query(self, query, progress):
+        """Delete everything matched by `query`, one batch at a time, fetching only document names."""
+        query = query.select([FieldPath.document_id()]).limit(DELETE_BATCH_SIZE)
+        while True:
+            docs = list(query.stream())
+            if not docs:
+                return
+            batch = self.db.batch()
+            for doc in docs:
+                batch.delete(doc.reference)
+            batch.commit()
+            progress(len(docs))
+
+    def _purge_chat(self, chat_id, progress):
+        chat_ref = self.db.collection("chats").document(chat_id)
+        self._delete_query(chat_ref.collection("messages"), progress)
+        chat_ref.delete()
+
+    def _purge_user(self, user_id, progress):
+        self._delete_query(self.db.collection("birds").where("userId", "==", user_id), progress)
+
+        chats = self.db.collection("chats").where("userId", "==", user_id)
+        for chat in chats.select([FieldPath.document_id()]).stream():
+            self._purge_chat(chat.id, progress)
+            progress(1)
+
+        self._delete_query(self.db.collection(SESSION_COLLECTION).where("userId", "==", user_id), progress)
+        self.db.collection(SUMMARY_COLLECTION).document(user_id).delete()
+        self.db.collection("users").document(user_id).delete()
+
+
+def _lease_expiry():
+    return datetime.now(timezone.utc) + timedelta(seconds=JOB_LEASE_SECONDS)
+
+
+def _claimable(job, owner, now):
+    if job.get("status") == "queued":
+        return True
+    if job.get("status") != "running":
+        return False
+    lease = job.get("leaseExpiresAt")
+    return job.get("owner") == owner or lease is None or lease <= now
@@ -1,151 +1,324 @@
 import numpy as np
-import pyaudio
 import time
-import geocoder
 import wave
-from birdnetlib import Recording
-from birdnetlib.analyzer import Analyzer
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
-import sys
-import firebase_admin
-from pytz import timezone 
-from firebase_admin import credentials, firestore
-from tensorflow.lite.python.interpreter import Interpreter
+import queue
+import threading
+from pytz import timezone
 import logging
+from detection_summaries import record_detections
+from detection_aggregator import DetectionAggregator
+from metrics import Counter, Histogram
 
-sys.stdout = open(os.devnull, 'w')
-sys.stderr = open(os.devnull, 'w')
+try:
+    import pyaudio
+except ImportError:
+    # Only needed for the microphone; replaying recorded audio works without PortAudio
+    pyaudio = None
 
 logging.getLogger("birdnetlib").setLevel(logging.ERROR)
 logging.getLogger("tensorflow").setLevel(logging.ERROR)
 logging.getLogger("pyaudio").setLevel(logging.ERROR)
 
-from dotenv import load_dotenv
-load_dotenv()
+RATE = 44100
+CHUNK = 2048
+SAMPLE_WIDTH = 2  # 16-bit samples (pyaudio.paInt16)
+CHANNELS = 1
+# Chunks held between the audio callback and the analysis loop (about 10 s), so audio
+# keeps being captured while BirdNET is busy with the previous segment
+CAPTURE_QUEUE_CHUNKS = int(os.getenv("CAPTURE_QUEUE_CHUNKS", 215))
 
-SERVICE_ACCOUNT_FILE = os.getenv("FIREBASE_ADMIN_CREDENTIALS", "backend/secrets/firebase-admin-key.json")
+noise_floor_duration = 10
+output_filename_template = "audio_samples_{count}.wav"
 
-cred = credentials.Certificate(SERVICE_ACCOUNT_FILE)
-firebase_admin.initialize_app(cred)
+DETECTOR_STAGE_SECONDS = Histogram(
+    "robin_detector_stage_seconds",
+    "Time spent in each detector stage (noise_gate per chunk, birdnet_inference, firestore_write).",
+    ["stage"]
+)
+DETECTOR_CHUNKS = Counter(
+    "robin_detector_chunks_total",
+    "Audio chunks captured, kept by the noise gate, or dropped because the analysis loop fell behind.",
+    ["outcome"]
+)
+DETECTOR_OVERFLOWS = Counter(
+    "robin_detector_input_overflows_total",
+    "Audio callbacks in which PortAudio reported an input overflow."
+)
+DETECTOR_DETECTIONS = Counter("robin_detector_detections_total", "Detections reported by BirdNET.")
+DETECTOR_RECORDS = Counter(
+    "robin_detector_records_total",
+    "Merged detection records written (created) or brought up to date (updated) by the detector.",
+    ["outcome"]
+)
 
-db = firestore.client()
 
-RATE = 44100 
-CHUNK = 2048  
-FORMAT = pyaudio.paInt16  
-CHANNELS = 1 
+class BirdDetector:
+    """
+    Listens to the microphone, keeps the loud 1-8 kHz stretches of audio and
+    runs BirdNET on each one, writing what it hears to the birds collection.
+    Repeated detections of a species are merged by a DetectionAggregator: the
+    record is written when the species is first heard and updated once more
+    when it goes quiet, instead of once per segment.
+    The Firestore client and BirdNET analyzer are passed in so a long-lived
+    service can reuse warm ones across runs.
+    """
 
-g = geocoder.ip('me')
+    def __init__(self, db, analyzer, user_id=None, location=None, noise_floor_threshold=None,
+                 analysis_lock=None):
+        self.db = db
+        self.analyzer = analyzer
+        self.user_id = user_id
+        self.location = location
+        self.noise_floor_threshold = noise_floor_threshold
+        self.calibrated_at = None
+        self.analysis_lock = analysis_lock or threading.Lock()
+        self.file_count = 0
+        self.aggregator = DetectionAggregator()
+        self._frames = queue.Queue(maxsize=CAPTURE_QUEUE_CHUNKS)
+        self.stats_lock = threading.Lock()
+        self.stats = {
+            "chunks_read": 0,
+            "input_overflows": 0,
+            "dropped_chunks": 0,
+            "chunks_kept": 0,
+            "segments_analyzed": 0,
+            "inference_seconds": 0.0,
+            "detections": 0,
+            "records_created": 0,
+            "records_updated": 0,
+            "firestore_writes": 0,
+            "firestore_seconds": 0.0,
+        }
 
-p = pyaudio.PyAudio()
-stream = p.open(format=FORMAT,
-                channels=CHANNELS,
-                rate=RATE,
-                input=True,
-                frames_per_buffer=CHUNK)
+    def _count(self, **increments):
+        with self.stats_lock:
+            for key, value in increments.items():
+                self.stats[key] += value
 
-window = np.blackman(CHUNK)  
-noise_floor_samples = []  
-noise_floor_duration = 10  
-noise_floor_threshold = 0 
-in_max_power = False  
-full_data = [] 
+    def snapshot_stats(self):
+        with self.stats_lock:
+            stats = dict(self.stats)
+        stats["queue_depth"] = self._frames.qsize()
+        return stats
 
-start_time = time.time()
-while time.time() - start_time < noise_floor_duration:
-    data = stream.read(CHUNK)  
-    audio_data = np.frombuffer(data, dtype=np.int16)
-    noise_floor_samples.extend(audio_data)
+    def _on_audio(self, in_data, frame_count, time_info, status):
+        """PortAudio callback: hand the chunk to the analysis loop without blocking."""
+        if status & pyaudio.paInputOverflow:
+            self._count(input_overflows=1)
+            DETECTOR_OVERFLOWS.inc()
+        try:
+            self._frames.put_nowait(in_data)
+        except queue.Full:
+            self._count(dropped_chunks=1)
+            DETECTOR_CHUNKS.inc("dropped")
+        return (None, pyaudio.paContinue)
 
-noise_fft_data = np.fft.fft(noise_floor_samples)
-noise_freqs = np.fft.fftfreq(len(noise_floor_samples), 1 / RATE)
-noise_power_spectrum = np.abs(noise_fft_data) ** 2
-noise_max_power_index = np.argmax(noise_power_spectrum)
-noise_max_freq = noise_freqs[noise_max_power_index]
-noise_max_power = noise_power_spectrum[noise_max_power_index]
-noise_floor_threshold = noise_max_power / 4  
+    def _read(self, stop_event):
+        """The next captured chunk, or None once `stop_event` is set."""
+        while not stop_event.is_set():
+            try:
+                return self._frames.get(timeout=0.25)
+            except queue.Empty:
+                continue
+        return None
+
+    def calibrate(self, stop_event):
+        """Listen for `noise_floor_duration` seconds of audio and set the noise threshold from the loudest frequency."""
+        noise_floor_samples = []
+        while len(noise_floor_samples) < noise_floor_duration * RATE:
+            data = self._read(stop_event)
+            if data is None:
+                return
+            audio_data = np.frombuffer(data, dtype=np.int16)
+            noise_floor_samples.extend(audio_data)
+
+        noise_fft_data = np.fft.fft(noise_floor_samples)
+        noise_power_spectrum = np.abs(noise_fft_data) ** 2
+        noise_max_power_index = np.argmax(noise_power_spectrum)
+        noise_max_power = noise_power_spectrum[noise_max_power_index]
+        self.noise_floor_threshold = noise_max_power / 4
+        self.calibrated_at = time.time()
+
+    def save_and_analyze(self, full_data, offset=0.0):
+        """Run BirdNET on a kept stretch of audio that began `offset` seconds into the session."""
+        from birdnetlib import Recording
+
+        duration = len(full_data) / RATE
+        if duration <= 3:
+            return
+        self.file_count += 1
+        output_filename = output_filename_template.format(count=self.file_count)
 
-output_filename_template = "audio_samples_{count}.wav"
-file_count = 0
-analyzer = Analyzer()
-analyzer.verbose = False 
-buffer = 100  
-
-def save_and_analyze(full_data):
-    global file_count
-    duration = len(full_data) / RATE
-    if duration > 3:  
-        file_count += 1
-        output_filename = output_filename_template.format(count=file_count)
-        
         with wave.open(output_filename, 'wb') as output_wavefile:
             output_wavefile.setnchannels(CHANNELS)
-            output_wavefile.setsampwidth(p.get_sample_size(FORMAT))
+            output_wavefile.setsampwidth(SAMPLE_WIDTH)
             output_wavefile.setframerate(RATE)
             output_wavefile.writeframes(full_data.tobytes())
 
-        recording = Recording(
-            analyzer,
-            output_filename,
-            lat=g.latlng[0],
-            lon=g.latlng[1],
-            date=datetime.now(),
-            min_conf=0.25,
-        )
-        recording.analyze()
-        birds = [item['common_name'] for item in recording.detections]
-        birds = list(set(birds)) 
-
-        eastern = timezone('US/Eastern')
-        current_time = datetime.now().astimezone(eastern) 
-        for bird in birds:
-            bird_data = {
-                "bird": bird,
-                "latitude": g.latlng[0],
-                "longitude": g.latlng[1],
-                "timestamp": current_time
-            }
-            db.collection("birds").add(bird_data)  
-        
-        os.remove(output_filename) 
+        try:
+            started = time.perf_counter()
+            recording = Recording(
+                self.analyzer,
+                output_filename,
+                lat=self.location[0],
+                lon=self.location[1],
+                date=datetime.now(),
+                min_conf=0.25,
+            )
+            with self.analysis_lock:
+                recording.analyze()
+            elapsed = time.perf_counter() - started
+            DETECTOR_STAGE_SECONDS.observe(elapsed, "birdnet_inference")
+            DETECTOR_DETECTIONS.inc(amount=len(recording.detections))
+            self._count(segments_analyzed=1, inference_seconds=elapsed, detections=len(recording.detections))
 
-try:
-    while True:
+            eastern = timezone('US/Eastern')
+            current_time = datetime.now().astimezone(eastern)
+            closed = self.aggregator.add_detections(
+                recording.detections, current_time - timedelta(seconds=duration),
+                self.location[0], self.location[1], offset
+            )
+            self.write_sightings(closed + self.aggregator.expire(current_time))
+        finally:
+            os.remove(output_filename)
+
+    def write_sightings(self, closed):
+        """
+        Create records for sightings not written yet, and update the records of
+        `closed` sightings that had more detections merged in since.
+        """
+        created = [s for s in self.aggregator.sightings() + closed if s.doc_id is None]
+        updated = [s for s in closed if s.doc_id is not None and s.count > s.written_count]
+        if not created and not updated:
+            return
+
+        started = time.perf_counter()
+        doc_ids = record_detections(self.db, self.user_id, [s.to_record(self.user_id) for s in created])
+        for sighting, doc_id in zip(created, doc_ids):
+            sighting.doc_id = doc_id
+            sighting.written_count = sighting.count
+        if updated:
+            batch = self.db.batch()
+            for sighting in updated:
+                batch.update(self.db.collection("birds").document(sighting.doc_id), sighting.to_update())
+            batch.commit()
+        elapsed = time.perf_counter() - started
+
+        DETECTOR_STAGE_SECONDS.observe(elapsed, "firestore_write")
+        DETECTOR_RECORDS.inc("created", amount=len(created))
+        DETECTOR_RECORDS.inc("updated", amount=len(updated))
+        self._count(records_created=len(created), records_updated=len(updated),
+                    firestore_writes=bool(created) + bool(updated), firestore_seconds=elapsed)
+
+    def run(self, stop_event):
+        """Listen to the microphone until `stop_event` is set."""
+        if self.location is None:
+            import geocoder
+            self.location = geocoder.ip('me').latlng
+
+        p = pyaudio.PyAudio()
+        stream = p.open(format=pyaudio.paInt16,
+                        channels=CHANNELS,
+                        rate=RATE,
+                        input=True,
+                        frames_per_buffer=CHUNK,
+                        stream_callback=self._on_audio)
         try:
-            data = stream.read(CHUNK, exception_on_overflow=False) 
-        except OSError as e:
-            continue
+            self.process(stop_event)
+        finally:
+            stream.stop_stream()
+            stream.close()
+            p.terminate()
 
-        audio_data = np.frombuffer(data, dtype=np.int16)
-        fft_data = np.fft.fft(audio_data * window)
+    def replay(self, chunks):
+        """
+        Run recorded audio through the same pipeline as fast as it can be
+        processed. `chunks` yields CHUNK-sample 16-bit mono byte strings at RATE.
+        """
+        stop_event = threading.Event()
+
+        def feed():
+            for chunk in chunks:
+                self._frames.put(chunk)
+            while not self._frames.empty():
+                time.sleep(0.01)
+            stop_event.set()
+
+        threading.Thread(target=feed, name="detector-replay", daemon=True).start()
+        self.process(stop_event)
+
+    def process(self, stop_event):
+        """Calibrate if needed, then gate and analyse captured chunks until `stop_event` is set."""
+        if self.noise_floor_threshold is None:
+            self.calibrate(stop_event)
+
+        window = np.blackman(CHUNK)
         freqs = np.fft.fftfreq(CHUNK, 1 / RATE)
-        power_spectrum = np.abs(fft_data) ** 2
-
-        max_power_index = np.argmax(power_spectrum)
-        max_freq = freqs[max_power_index]
-        max_power = power_spectrum[max_power_index]
-
-        if ((max_power > noise_floor_threshold) and (max_freq >= 1000 and max_freq <= 8000)) or (buffer < 150):
-            if not in_max_power:
-                buffer = 0
-                in_max_power = True
-            if max_power > noise_floor_threshold and (max_freq >= 1000 and max_freq <= 8000):
-                buffer = 0
-            full_data.extend(audio_data)
-            buffer += 1
-        else:
-            in_max_power = False
-            if full_data:
-                save_and_analyze(np.array(full_data)) 
-                full_data = []
-            buffer = 100 
-
-
-except KeyboardInterrupt:
-    print("Recording stopped by user.")
-
-finally:
-    stream.stop_stream()
-    stream.close()
-    p.terminate()
\ No newline at end of file
+        in_max_power = False
+        full_data = []
+        segment_offset = 0.0
+        chunk_index = -1
+        buffer = 100
+
+        while True:
+            data = self._read(stop_event)
+            if data is None:
+                break
+            chunk_index += 1
+            self._count(chunks_read=1)
+            DETECTOR_CHUNKS.inc("read")
+
+            with DETECTOR_STAGE_SECONDS.time("noise_gate"):
+                audio_data = np.frombuffer(data, dtype=np.int16)
+                fft_data = np.fft.fft(audio_data * window)
+                power_spectrum = np.abs(fft_data) ** 2
+
+                max_power_index = np.argmax(power_spectrum)
+                max_freq = freqs[max_power_index]
+                max_power = power_spectrum[max_power_index]
+
+                loud = max_power > self.noise_floor_threshold and (max_freq >= 1000 and max_freq <= 8000)
+            if loud or (buffer < 150):
+                if not in_max_power:
+                    buffer = 0
+                    in_max_power = True
+                if loud:
+                    buffer = 0
+                if not full_data:
+                    segment_offset = chunk_index * CHUNK / RATE
+                full_data.extend(audio_data)
+                buffer += 1
+                self._count(chunks_kept=1)
+                DETECTOR_CHUNKS.inc("kept")
+            else:
+                in_max_power = False
+                if full_data:
+                    self.save_and_analyze(np.array(full_data), segment_offset)
+                    full_data = []
+                buffer = 100
+
+        # Bring the records of species still being heard up to date
+        self.write_sightings(self.aggregator.expire())
+
+
+if __name__ == "__main__":
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+    from birdnetlib.analyzer import Analyzer
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    SERVICE_ACCOUNT_FILE = os.getenv("FIREBASE_ADMIN_CREDENTIALS", "backend/secrets/firebase-admin-key.json")
+    firebase_admin.initialize_app(credentials.Certificate(SERVICE_ACCOUNT_FILE))
+
+    analyzer = Analyzer()
+    analyzer.verbose = False
+
+    # Set when detection is started on behalf of a logged-in user
+    detector = BirdDetector(firestore.client(), analyzer, user_id=os.getenv("DETECTION_USER_ID"))
+    try:
+        detector.run(threading.Event())
+    except KeyboardInterrupt:
+        print("Recording stopped by user.")
@@ -0,0 +1,121 @@
+import os
+from datetime import timedelta
+from hotspots import haversine_distance
+
+# Detections of a species closer together than this are merged into one record
+AGGREGATION_WINDOW_SECONDS = int(os.getenv("AGGREGATION_WINDOW_SECONDS", 5 * 60))
+# ...as long as they were also heard within this distance of where the record started
+AGGREGATION_RADIUS_KM = float(os.getenv("AGGREGATION_RADIUS_KM", 0.5))
+MERGED_FIELDS = ["lastTimestamp", "count", "maxConfidence", "meanConfidence", "startOffset", "endOffset"]
+
+
+class Sighting:
+    """Repeated detections of one species, merged into a single `birds` record."""
+
+    def __init__(self, bird, confidence, start, end, timestamp, latitude, longitude):
+        self.bird = bird
+        self.latitude = latitude
+        self.longitude = longitude
+        self.first_seen = timestamp
+        self.last_seen = timestamp
+        self.start_offset = start
+        self.end_offset = end
+        self.count = 1
+        self.max_confidence = confidence
+        self.confidence_sum = confidence
+        # Set once the record has been written, so later merges can update it
+        self.doc_id = None
+        self.written_count = 0
+
+    def merge(self, confidence, start, end, timestamp):
+        self.count += 1
+        self.max_confidence = max(self.max_confidence, confidence)
+        self.confidence_sum += confidence
+        self.start_offset = min(self.start_offset, start)
+        self.end_offset = max(self.end_offset, end)
+        self.first_seen = min(self.first_seen, timestamp)
+        self.last_seen = max(self.last_seen, timestamp)
+
+    def to_record(self, user_id=None):
+        record = {
+            "bird": self.bird,
+            "latitude": self.latitude,
+            "longitude": self.longitude,
+            "timestamp": self.first_seen,
+            "lastTimestamp": self.last_seen,
+            "count": self.count,
+            "maxConfidence": round(self.max_confidence, 4),
+            "meanConfidence": round(self.confidence_sum / self.count, 4),
+            "startOffset": round(self.start_offset, 2),
+            "endOffset": round(self.end_offset, 2),
+        }
+        if user_id:
+            record["userId"] = user_id
+        return record
+
+    def to_update(self):
+        """The fields that change as detections are merged into an already written record."""
+        record = self.to_record()
+        return {field: record[field] for field in MERGED_FIELDS}
+
+
+class DetectionAggregator:
+    """
+    Merges BirdNET detections of the same species heard within `window_seconds`
+    of each other and `radius_km` of the same place, keeping the count, max and
+    mean confidence, the first/last timestamps and the earliest start and latest
+    end offset (seconds into the recording or listening session).
+    """
+
+    def __init__(self, window_seconds=AGGREGATION_WINDOW_SECONDS, radius_km=AGGREGATION_RADIUS_KM):
+        self.window = timedelta(seconds=window_seconds)
+        self.radius_km = radius_km
+        # species -> open Sighting
+        self._open = {}
+
+    def add(self, bird, confidence, start, end, timestamp, latitude, longitude):
+        """
+        Fold one detection in. Returns `(sighting, closed)`: the sighting it now
+        belongs to, and the previous sighting of the species if this detection
+        was too late or too far away to join it (else None).
+        """
+        current = self._open.get(bird)
+        if current is not None:
+            near = haversine_distance(current.latitude, current.longitude, latitude, longitude) <= self.radius_km
+            if near and timestamp - current.last_seen <= self.window:
+                current.merge(confidence, start, end, timestamp)
+                return current, None
+
+        sighting = Sighting(bird, confidence, start, end, timestamp, latitude, longitude)
+        self._open[bird] = sighting
+        return sighting, current
+
+    def add_detections(self, detections, timestamp, latitude, longitude, offset=0.0):
+        """
+        Fold in a BirdNET `recording.detections` list for a recording that began
+        at `timestamp`, `offset` seconds into the session. Returns the sightings
+        closed on the way.
+        """
+        closed = []
+        for item in detections:
+            _, previous = self.add(
+                item["common_name"], item["confidence"],
+                offset + item["start_time"], offset + item["end_time"],
+                timestamp + timedelta(seconds=item["start_time"]), latitude, longitude
+            )
+            if previous is not None:
+                closed.append(previous)
+        return closed
+
+    def expire(self, now=None):
+        """Close and return the sightings with nothing new within the window of `now`; all of them if `now` is None."""
+        expired = [
+            sighting for sighting in self._open.values()
+            if now is None or now - sighting.last_seen > self.window
+        ]
+        for sighting in expired:
+            del self._open[sighting.bird]
+        return expired
+
+    def sightings(self):
+        return list(self._open.values())
@@ -0,0 +1,189 @@
+import io
+import os
+import csv
+import sys
+import json
+import argparse
+from datetime import datetime
+from firebase_admin import firestore
+from google.cloud.firestore_v1.field_path import FieldPath
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+EXPORT_FIELDS = [
+    "id", "bird", "latitude", "longitude", "timestamp", "userId",
+    "lastTimestamp", "count", "maxConfidence", "meanConfidence", "startOffset", "endOffset"
+]
+DEFAULT_PAGE_SIZE = 1000
+
+
+def iter_detection_pages(db, user_id=None, page_size=DEFAULT_PAGE_SIZE, since=None):
+    """
+    Yield lists of detection dicts from the `birds` collection one page at a
+    time, paging with a cursor so every query stays short-lived. Pages are
+    in document id order, or in write order when `since` restricts the read
+    to detections written after it (`createdAt`, set by record_detections).
+    """
+    query = db.collection("birds")
+    if user_id:
+        query = query.where("userId", "==", user_id)
+    if since is not None:
+        query = query.where("createdAt", ">", since).order_by("createdAt")
+    query = query.order_by(FieldPath.document_id()).limit(page_size)
+
+    last_doc = None
+    while True:
+        page_query = query.start_after(last_doc) if last_doc is not None else query
+        docs = list(page_query.stream())
+        if not docs:
+            return
+
+        rows = []
+        for doc in docs:
+            data = doc.to_dict()
+            data["id"] = doc.id
+            rows.append(data)
+        yield rows
+
+        if len(docs) < page_size:
+            return
+        last_doc = docs[-1]
+
+
+def iter_detections(db, user_id=None, page_size=DEFAULT_PAGE_SIZE):
+    for rows in iter_detection_pages(db, user_id=user_id, page_size=page_size):
+        yield from rows
+
+
+def _export_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _iter_csv(pages):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    for rows in pages:
+        for row in rows:
+            writer.writerow({field: _export_value(row.get(field)) for field in EXPORT_FIELDS})
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _iter_ndjson(pages):
+    for rows in pages:
+        yield "".join(
+            json.dumps({field: _export_value(row.get(field)) for field in EXPORT_FIELDS}) + "\n"
+            for row in rows
+        )
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that hands back whatever was written since the last drain."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _iter_parquet(pages):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("id", pa.string()),
+        ("bird", pa.string()),
+        ("latitude", pa.float64()),
+        ("longitude", pa.float64()),
+        ("timestamp", pa.timestamp("us", tz="UTC")),
+        ("userId", pa.string()),
+        # Merged-detection fields; empty for records written before detections were aggregated
+        ("lastTimestamp", pa.timestamp("us", tz="UTC")),
+        ("count", pa.int64()),
+        ("maxConfidence", pa.float64()),
+        ("meanConfidence", pa.float64()),
+        ("startOffset", pa.float64()),
+        ("endOffset", pa.float64()),
+    ])
+
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for rows in pages:
+            # One row group per page keeps memory bounded by the page size
+            columns = {field: [row.get(field) for row in rows] for field in EXPORT_FIELDS}
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    finally:
+        writer.close()
+    chunk = sink.drain()
+    if chunk:
+        yield chunk
+
+
+def iter_export(db, fmt, user_id=None, page_size=DEFAULT_PAGE_SIZE):
+    """Stream a detection export as text (csv/ndjson) or bytes (parquet) chunks."""
+    pages = iter_detection_pages(db, user_id=user_id, page_size=page_size)
+    if fmt == "csv":
+        return _iter_csv(pages)
+    if fmt == "ndjson":
+        return _iter_ndjson(pages)
+    if fmt == "parquet":
+        return _iter_parquet(pages)
+    raise ValueError(f"Unsupported export format: {fmt}")
+
+
+if __name__ == "__main__":
+    import firebase_admin
+    from firebase_admin import credentials
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Export detections from the birds collection.")
+    parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="csv")
+    parser.add_argument("--user", help="Only export detections for this user id (default: all users)")
+    parser.add_argument("--out", help="Output file (default: stdout)")
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE)
+    args = parser.parse_args()
+
+    cred_path = os.getenv("FIREBASE_ADMIN_CREDENTIALS", "backend/secrets/firebase-admin-key.json")
+    firebase_admin.initialize_app(credentials.Certificate(cred_path))
+
+    binary = args.format == "parquet"
+    if args.out:
+        out = open(args.out, "wb" if binary else "w", encoding=None if binary else "utf-8", newline=None if binary else "")
+    else:
+        out = sys.stdout.buffer if binary else sys.stdout
+
+    try:
+        for chunk in iter_export(firestore.client(), args.format, user_id=args.user, page_size=args.page_size):
+            out.write(chunk)
+    finally:
+        if args.out:
+            out.close()
@@ -0,0 +1,96 @@
+import os
+import time
+import threading
+from datetime import datetime, timedelta, timezone
+from spatial_index import GridIndex
+
+RECENT_DETECTION_DAYS = int(os.getenv("RECENT_DETECTION_DAYS", 7))
+# Re-subscribe with a fresh cutoff so the listener's own snapshot doesn't grow forever
+LISTENER_REFRESH_SECONDS = int(os.getenv("DETECTION_LISTENER_REFRESH_SECONDS", 6 * 60 * 60))
+INITIAL_SNAPSHOT_TIMEOUT = 30
+PRUNE_INTERVAL_SECONDS = 60
+
+
+class DetectionFeed:
+    """
+    In-memory view of recent `birds` detections, kept current by a Firestore
+    snapshot listener so new detections from any worker or the detector show
+    up without re-reading the collection. Detections are held in a GridIndex
+    for radius and nearest-neighbour queries.
+    """
+
+    def __init__(self, window_days=RECENT_DETECTION_DAYS):
+        self.window = timedelta(days=window_days)
+        self.index = GridIndex()
+        self._subscribers = []
+        self._watch = None
+        self._started_at = 0.0
+        self._last_prune = 0.0
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback):
+        """Call `callback(doc_id, data)` for every detection added after the initial load."""
+        self._subscribers.append(callback)
+
+    def ensure_started(self, db):
+        """Start (or refresh) the listener and wait for the initial snapshot."""
+        with self._lock:
+            stale = self._watch is not None and time.monotonic() - self._started_at > LISTENER_REFRESH_SECONDS
+            if self._watch is None or stale:
+                if stale:
+                    self._watch.unsubscribe()
+                cutoff = datetime.now(timezone.utc) - self.window
+                query = db.collection("birds").where("timestamp", ">=", cutoff)
+                self._started_at = time.monotonic()
+                self._watch = query.on_snapshot(self._on_snapshot)
+        self._ready.wait(INITIAL_SNAPSHOT_TIMEOUT)
+
+    def stop(self):
+        with self._lock:
+            if self._watch is not None:
+                self._watch.unsubscribe()
+                self._watch = None
+            self._ready.clear()
+
+    def _on_snapshot(self, docs, changes, read_time):
+        initial = not self._ready.is_set()
+        for change in changes:
+            doc = change.document
+            if change.type.name == "REMOVED":
+                self.index.remove(doc.id)
+                continue
+
+            data = doc.to_dict()
+            if data.get("latitude") is None or data.get("longitude") is None:
+                continue
+            is_new = doc.id not in self.index
+            self.index.add(doc.id, data["latitude"], data["longitude"], {
+                "id": doc.id,
+                "bird": data.get("bird"),
+                "latitude": data["latitude"],
+                "longitude": data["longitude"],
+                "timestamp": data.get("timestamp"),
+            })
+            if is_new and not initial and change.type.name == "ADDED":
+                for callback in self._subscribers:
+                    try:
+                        callback(doc.id, data)
+                    except Exception as e:
+                        print(f"Detection feed subscriber failed: {str(e)}")
+
+        if time.monotonic() - self._last_prune > PRUNE_INTERVAL_SECONDS:
+            self._last_prune = time.monotonic()
+            cutoff = datetime.now(timezone.utc) - self.window
+            self.index.remove_where(lambda payload: payload["timestamp"] is None or payload["timestamp"] < cutoff)
+        self._ready.set()
+
+    def query_radius(self, lat, lon, radius_miles, since=None):
+        """Recent detections within the radius, nearest first, optionally only those after `since`."""
+        results = self.index.query_radius(lat, lon, radius_miles)
+        if since is None:
+            return results
+        return [(dist, p) for dist, p in results if p["timestamp"] is not None and p["timestamp"] >= since]
+
+    def nearest(self, lat, lon, k):
+        return self.index.nearest(lat, lon, k)
@@ -0,0 +1,348 @@
+import os
+import sys
+import json
+import time
+import threading
+import subprocess
+import requests
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DETECTION_SERVICE_HOST = os.getenv("DETECTION_SERVICE_HOST", "127.0.0.1")
+DETECTION_SERVICE_PORT = int(os.getenv("DETECTION_SERVICE_PORT", 5055))
+# Let the web server launch the service the first time detection is started
+DETECTION_SERVICE_SPAWN = os.getenv("DETECTION_SERVICE_SPAWN", "1") == "1"
+DETECTION_SERVICE_START_TIMEOUT = int(os.getenv("DETECTION_SERVICE_START_TIMEOUT", 60))
+# How long a measured noise floor is reused before the next start recalibrates
+NOISE_FLOOR_MAX_AGE = int(os.getenv("NOISE_FLOOR_MAX_AGE", 30 * 60))
+CONTROL_TIMEOUT = 2
+STOP_WAIT_SECONDS = 1
+
+
+class DetectionService:
+    """
+    Runs the microphone detector on a thread inside one long-lived process,
+    so BirdNET, TensorFlow and Firestore stay loaded between runs. The
+    location and noise floor from the last run are reused for the next one.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop_event = None
+        self._detector = None
+        self.user_id = None
+        self.started_at = None
+        self.stopped_at = None
+        self.last_error = None
+        self.runs = 0
+        self.location = None
+        self.noise_floor_threshold = None
+        self.calibrated_at = None
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, user_id):
+        """Start listening on behalf of `user_id`; False if a run is already in progress."""
+        from detect_birds import BirdDetector
+        from warmup import analysis_lock
+
+        with self._lock:
+            if self.is_running():
+                return False
+            threshold = None
+            if self.calibrated_at is not None and time.time() - self.calibrated_at < NOISE_FLOOR_MAX_AGE:
+                threshold = self.noise_floor_threshold
+
+            self._stop_event = threading.Event()
+            self._detector = BirdDetector(
+                self.db, None, user_id=user_id, location=self.location,
+                noise_floor_threshold=threshold, analysis_lock=analysis_lock
+            )
+            self.user_id = user_id
+            self.started_at = time.time()
+            self.stopped_at = None
+            self.last_error = None
+            self.runs += 1
+            self._thread = threading.Thread(
+                target=self._run, args=(self._detector, self._stop_event), name="bird-detector", daemon=True
+            )
+            self._thread.start()
+            return True
+
+    def stop(self):
+        """Ask the running detector to stop; False if nothing is running."""
+        with self._lock:
+            if not self.is_running():
+                return False
+            self._stop_event.set()
+            thread = self._thread
+        # The loop checks the event after every 46 ms chunk; an analysis in progress finishes first
+        thread.join(STOP_WAIT_SECONDS)
+        return True
+
+    def _run(self, detector, stop_event):
+        from warmup import get_analyzer
+
+        try:
+            detector.analyzer = get_analyzer()
+            detector.run(stop_event)
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"Detection stopped with an error: {str(e)}")
+        finally:
+            self.location = detector.location
+            if detector.calibrated_at is not None:
+                self.noise_floor_threshold = detector.noise_floor_threshold
+                self.calibrated_at = detector.calibrated_at
+            self.stopped_at = time.time()
+
+    def queue_depth(self):
+        """Captured audio chunks waiting for the analysis loop."""
+        detector = self._detector
+        return detector.snapshot_stats()["queue_depth"] if detector is not None and self.is_running() else 0
+
+    def profile(self, seconds):
+        """Sample the detector thread for `seconds` and return collapsed stacks; None if it isn't running."""
+        from profiler import profile_for
+
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return None
+        return profile_for([thread.ident], seconds)
+
+    def health(self):
+        """Run state, plus counters and per-stage throughput for the current or last run."""
+        from warmup import startup_report
+
+        running = self.is_running()
+        if running and self._stop_event.is_set():
+            state = "stopping"
+        elif running:
+            state = "running"
+        else:
+            state = "idle"
+
+        report = {
+            "running": running,
+            "state": state,
+            "userId": self.user_id if running else None,
+            "pid": os.getpid(),
+            "runs": self.runs,
+            "modelLoaded": startup_report()["birdnetLoaded"],
+            "calibrated": self.calibrated_at is not None or (
+                self._detector is not None and self._detector.calibrated_at is not None
+            ),
+            "lastError": self.last_error,
+            "stages": None,
+        }
+        if self._detector is None:
+            return report
+
+        stats = self._detector.snapshot_stats()
+        elapsed = max((self.stopped_at or time.time()) - self.started_at, 1e-9)
+        segments = stats["segments_analyzed"]
+        writes = stats["firestore_writes"]
+        report["uptime"] = round(elapsed, 1)
+        report["stages"] = {
+            "capture": {
+                "chunks": stats["chunks_read"],
+                "chunksPerSecond": round(stats["chunks_read"] / elapsed, 2),
+                "inputOverflows": stats["input_overflows"],
+                "droppedChunks": stats["dropped_chunks"],
+                "queueDepth": stats["queue_depth"],
+            },
+            "noiseGate": {
+                "chunksKept": stats["chunks_kept"],
+                "keptRatio": round(stats["chunks_kept"] / stats["chunks_read"], 3) if stats["chunks_read"] else 0.0,
+            },
+            "inference": {
+                "segments": segments,
+                "segmentsPerMinute": round(segments * 60 / elapsed, 2),
+                "detections": stats["detections"],
+                "meanMs": round(stats["inference_seconds"] * 1000 / segments, 1) if segments else None,
+            },
+            "firestore": {
+                "writes": writes,
+                "recordsCreated": stats["records_created"],
+                "recordsUpdated": stats["records_updated"],
+                "meanMs": round(stats["firestore_seconds"] * 1000 / writes, 1) if writes else None,
+            },
+        }
+        return report
+
+
+class ControlHandler(BaseHTTPRequestHandler):
+    """
+    Control API: POST /start {"userId"}, POST /stop, GET /health, GET /metrics
+    (Prometheus text) and POST /profile?seconds=N (collapsed stacks of the
+    detector thread).
+    """
+
+    def _reply(self, status, body, content_type="application/json"):
+        payload = body.encode("utf-8") if isinstance(body, str) else json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length))
+
+    def do_GET(self):
+        from metrics import REGISTRY
+
+        if self.path == "/health":
+            return self._reply(200, self.server.service.health())
+        if self.path == "/metrics":
+            return self._reply(200, REGISTRY.render(), "text/plain; version=0.0.4")
+        self._reply(404, {"error": "Not found"})
+
+    def do_POST(self):
+        service = self.server.service
+        try:
+            if self.path == "/start":
+                started = service.start(self._read_json().get("userId"))
+                return self._reply(200, {"started": started})
+            if self.path == "/stop":
+                return self._reply(200, {"stopped": service.stop()})
+            url = urlparse(self.path)
+            if url.path == "/profile":
+                seconds = float(parse_qs(url.query).get("seconds", ["10"])[0])
+                collapsed = service.profile(seconds)
+                if collapsed is None:
+                    return self._reply(409, {"error": "Bird detection is not running"})
+                return self._reply(200, collapsed, "text/plain")
+        except Exception as e:
+            return self._reply(500, {"error": str(e)})
+        self._reply(404, {"error": "Not found"})
+
+    def log_message(self, format, *args):
+        pass
+
+
+class DetectionServiceClient:
+    """
+    Used by the web server to drive the detection service. Every worker talks
+    to the same service, so its answer is the one source of truth for whether
+    detection is running.
+    """
+
+    def __init__(self, host=DETECTION_SERVICE_HOST, port=DETECTION_SERVICE_PORT):
+        self.base_url = f"http://{host}:{port}"
+        self._spawn_lock = threading.Lock()
+
+    def _request(self, method, path, payload=None, timeout=CONTROL_TIMEOUT, accept=(200,)):
+        response = requests.request(method, self.base_url + path, json=payload, timeout=timeout)
+        if response.status_code not in accept:
+            try:
+                error = response.json().get("error")
+            except ValueError:
+                error = None
+            raise RuntimeError(error or f"Detection service returned {response.status_code}")
+        return response
+
+    def _call(self, method, path, payload=None):
+        return self._request(method, path, payload).json()
+
+    def health(self):
+        """The service's health report, or None if it isn't running."""
+        try:
+            return self._call("GET", "/health")
+        except requests.ConnectionError:
+            return None
+
+    def ensure_running(self):
+        if self.health() is not None:
+            return
+        if not DETECTION_SERVICE_SPAWN:
+            raise RuntimeError("Detection service is not running")
+        with self._spawn_lock:
+            if self.health() is not None:
+                return
+            # If another worker spawns one at the same time, whichever binds the port second exits
+            subprocess.Popen(
+                [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "detection_service.py")],
+                start_new_session=True
+            )
+            deadline = time.monotonic() + DETECTION_SERVICE_START_TIMEOUT
+            while time.monotonic() < deadline:
+                time.sleep(0.2)
+                if self.health() is not None:
+                    return
+        raise RuntimeError("Detection service did not start")
+
+    def start(self, user_id):
+        """Start detection for `user_id`; False if it is already running."""
+        self.ensure_running()
+        return self._call("POST", "/start", {"userId": user_id})["started"]
+
+    def stop(self):
+        """Stop detection; False if it wasn't running."""
+        try:
+            return self._call("POST", "/stop")["stopped"]
+        except requests.ConnectionError:
+            return False
+
+    def is_running(self):
+        health = self.health()
+        return bool(health and health["running"])
+
+    def metrics(self):
+        """The service's metrics in Prometheus text format, or "" if it isn't running."""
+        try:
+            return self._request("GET", "/metrics").text
+        except requests.ConnectionError:
+            return ""
+
+    def profile(self, seconds):
+        """Collapsed stacks from sampling the detector loop for `seconds`, or None if detection isn't running."""
+        try:
+            response = self._request(
+                "POST", f"/profile?seconds={seconds}", timeout=seconds + CONTROL_TIMEOUT, accept=(200, 409)
+            )
+        except requests.ConnectionError:
+            return None
+        return response.text if response.status_code == 200 else None
+
+
+if __name__ == "__main__":
+    import argparse
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+    from dotenv import load_dotenv
+    from warmup import start_warmup
+    from metrics import Gauge
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Long-lived bird detection service with a local control API.")
+    parser.add_argument("--host", default=DETECTION_SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=DETECTION_SERVICE_PORT)
+    args = parser.parse_args()
+
+    # Binding the port first means only one service runs however many workers try to spawn it
+    try:
+        server = ThreadingHTTPServer((args.host, args.port), ControlHandler)
+    except OSError:
+        print(f"Detection service already running on {args.host}:{args.port}")
+        sys.exit(0)
+    server.daemon_threads = True
+
+    SERVICE_ACCOUNT_FILE = os.getenv("FIREBASE_ADMIN_CREDENTIALS", "backend/secrets/firebase-admin-key.json")
+    firebase_admin.initialize_app(credentials.Certificate(SERVICE_ACCOUNT_FILE))
+    server.service = DetectionService(firestore.client())
+    Gauge("robin_detector_queue_depth", "Captured audio chunks waiting for the analysis loop.",
+          fn=server.service.queue_depth)
+
+    start_warmup()
+    print(f"Detection service listening on {args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.service.stop()
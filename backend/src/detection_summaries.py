@@ -0,0 +1,142 @@
+import os
+import argparse
+from pytz import timezone
+from firebase_admin import firestore
+
+SUMMARY_COLLECTION = "userSummaries"
+EASTERN = timezone('US/Eastern')
+
+
+def empty_summary(user_id):
+    return {
+        "userId": user_id,
+        "totalDetections": 0,
+        "species": {},
+        "days": {},
+    }
+
+
+def apply_detection(summary, bird, timestamp, last_seen=None):
+    """
+    Fold a single detection into a summary dict in place. `last_seen` is when
+    a merged record was last heard (its `lastTimestamp`); it defaults to
+    `timestamp`.
+    """
+    last_seen = last_seen or timestamp
+    summary["totalDetections"] = summary.get("totalDetections", 0) + 1
+
+    species = summary.setdefault("species", {})
+    entry = species.get(bird)
+    if entry is None:
+        species[bird] = {"count": 1, "firstSeen": timestamp, "lastSeen": last_seen}
+    else:
+        entry["count"] = entry.get("count", 0) + 1
+        if entry.get("firstSeen") is None or timestamp < entry["firstSeen"]:
+            entry["firstSeen"] = timestamp
+        if entry.get("lastSeen") is None or last_seen > entry["lastSeen"]:
+            entry["lastSeen"] = last_seen
+
+    day = timestamp.astimezone(EASTERN).strftime("%Y-%m-%d")
+    days = summary.setdefault("days", {})
+    days[day] = days.get(day, 0) + 1
+
+
+def record_detections(db, user_id, records):
+    """
+    Write detection records to the `birds` collection and, when the detections
+    belong to a user, update that user's summary document in the same commit.
+    Each record is stamped with `createdAt`, the time it was written, which is
+    what incremental readers such as the forecast pipeline page on; the
+    detection's own `timestamp` can be earlier. Returns the ids of the new
+    `birds` documents.
+    """
+    if not records:
+        return []
+
+    birds_ref = db.collection("birds")
+    doc_refs = [birds_ref.document() for _ in records]
+    records = [{**record, "createdAt": firestore.SERVER_TIMESTAMP} for record in records]
+
+    if not user_id:
+        batch = db.batch()
+        for doc_ref, record in zip(doc_refs, records):
+            batch.set(doc_ref, record)
+        batch.commit()
+        return [doc_ref.id for doc_ref in doc_refs]
+
+    summary_ref = db.collection(SUMMARY_COLLECTION).document(user_id)
+
+    @firestore.transactional
+    def write(transaction):
+        snapshot = summary_ref.get(transaction=transaction)
+        summary = snapshot.to_dict() if snapshot.exists else empty_summary(user_id)
+        for doc_ref, record in zip(doc_refs, records):
+            transaction.set(doc_ref, record)
+            apply_detection(summary, record["bird"], record["timestamp"], record.get("lastTimestamp", record["timestamp"]))
+        summary["updatedAt"] = firestore.SERVER_TIMESTAMP
+        transaction.set(summary_ref, summary)
+
+    write(db.transaction())
+    return [doc_ref.id for doc_ref in doc_refs]
+
+
+def get_summary(db, user_id):
+    """Read a user's summary with a single document read."""
+    snapshot = db.collection(SUMMARY_COLLECTION).document(user_id).get()
+    if not snapshot.exists:
+        return empty_summary(user_id)
+    return snapshot.to_dict()
+
+
+def rebuild_summaries(db, user_id=None, batch_size=400):
+    """
+    Recompute summaries from the `birds` collection. Detections without a
+    userId (e.g. from a standalone detector) are skipped.
+    """
+    query = db.collection("birds")
+    if user_id:
+        query = query.where("userId", "==", user_id)
+
+    summaries = {}
+    if user_id:
+        summaries[user_id] = empty_summary(user_id)
+
+    for doc in query.stream():
+        data = doc.to_dict()
+        owner = data.get("userId")
+        if not owner or not data.get("bird") or data.get("timestamp") is None:
+            continue
+        summary = summaries.setdefault(owner, empty_summary(owner))
+        apply_detection(summary, data["bird"], data["timestamp"], data.get("lastTimestamp", data["timestamp"]))
+
+    batch = db.batch()
+    pending = 0
+    for owner, summary in summaries.items():
+        summary["updatedAt"] = firestore.SERVER_TIMESTAMP
+        batch.set(db.collection(SUMMARY_COLLECTION).document(owner), summary)
+        pending += 1
+        if pending >= batch_size:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+    if pending:
+        batch.commit()
+
+    return len(summaries)
+
+
+if __name__ == "__main__":
+    import firebase_admin
+    from firebase_admin import credentials
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Rebuild per-user detection summaries from the birds collection.")
+    parser.add_argument("--user", help="Only rebuild the summary for this user id")
+    args = parser.parse_args()
+
+    cred_path = os.getenv("FIREBASE_ADMIN_CREDENTIALS", "backend/secrets/firebase-admin-key.json")
+    firebase_admin.initialize_app(credentials.Certificate(cred_path))
+
+    count = rebuild_summaries(firestore.client(), user_id=args.user)
+    print(f"Rebuilt {count} summaries.")
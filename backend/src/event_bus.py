@@ -0,0 +1,126 @@
+import os
+import threading
+from collections import deque
+from cachetools import TTLCache
+
+# Events held for a subscriber that isn't reading fast enough; the oldest are dropped beyond this
+EVENT_BUFFER_SIZE = int(os.getenv("EVENT_BUFFER_SIZE", 100))
+# Open streams allowed per user; opening another closes the oldest
+MAX_STREAMS_PER_USER = int(os.getenv("MAX_STREAMS_PER_USER", 3))
+# How long an event id is remembered so the same detection isn't delivered twice
+DEDUP_TTL_SECONDS = 10 * 60
+DEDUP_SIZE = 10000
+
+
+class Subscription:
+    """One subscriber's bounded queue of events."""
+
+    def __init__(self, user_id, maxlen):
+        self.user_id = user_id
+        self.maxlen = maxlen
+        self.closed = False
+        self.dropped = 0
+        self._events = deque()
+        self._unreported_drops = 0
+        self._cond = threading.Condition()
+
+    def push(self, event):
+        """Queue `event`; True if the oldest queued event had to be dropped to make room."""
+        with self._cond:
+            if self.closed:
+                return False
+            overflowed = len(self._events) >= self.maxlen
+            if overflowed:
+                self._events.popleft()
+                self.dropped += 1
+                self._unreported_drops += 1
+            self._events.append(event)
+            self._cond.notify()
+            return overflowed
+
+    def depth(self):
+        with self._cond:
+            return len(self._events)
+
+    def wait(self, timeout):
+        """
+        Wait up to `timeout` seconds for events. Returns the queued events and
+        how many were dropped since the last call; both are empty/0 on timeout.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._events or self.closed, timeout)
+            events = list(self._events)
+            self._events.clear()
+            drops, self._unreported_drops = self._unreported_drops, 0
+            return events, drops
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+class EventBus:
+    """
+    In-process publish/subscribe keyed by user id. Each subscriber has its own
+    bounded buffer, so one slow stream can't hold up publishers or other
+    subscribers. Events carry an id and are delivered at most once even when
+    they are published by more than one source.
+    """
+
+    def __init__(self, buffer_size=EVENT_BUFFER_SIZE, max_per_user=MAX_STREAMS_PER_USER):
+        self.buffer_size = buffer_size
+        self.max_per_user = max_per_user
+        self._subscribers = {}
+        self._seen = TTLCache(maxsize=DEDUP_SIZE, ttl=DEDUP_TTL_SECONDS)
+        self._lock = threading.Lock()
+        self.published = 0
+        self.duplicates = 0
+        self.dropped = 0
+
+    def subscribe(self, user_id):
+        subscription = Subscription(user_id, self.buffer_size)
+        with self._lock:
+            subscriptions = self._subscribers.setdefault(user_id, [])
+            subscriptions.append(subscription)
+            evicted = subscriptions[:-self.max_per_user] if len(subscriptions) > self.max_per_user else []
+            del subscriptions[:len(evicted)]
+        for old in evicted:
+            old.close()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscription.close()
+        with self._lock:
+            subscriptions = self._subscribers.get(subscription.user_id, [])
+            if subscription in subscriptions:
+                subscriptions.remove(subscription)
+            if not subscriptions:
+                self._subscribers.pop(subscription.user_id, None)
+
+    def publish(self, user_id, event_id, event):
+        """Deliver `event` to the user's subscribers unless `event_id` was already published."""
+        with self._lock:
+            if event_id in self._seen:
+                self.duplicates += 1
+                return 0
+            self._seen[event_id] = True
+            self.published += 1
+            subscriptions = list(self._subscribers.get(user_id, ()))
+        dropped = sum(subscription.push(event) for subscription in subscriptions)
+        if dropped:
+            with self._lock:
+                self.dropped += dropped
+        return len(subscriptions)
+
+    def stats(self):
+        with self._lock:
+            subscriptions = [s for subs in self._subscribers.values() for s in subs]
+            return {
+                "users": len(self._subscribers),
+                "subscribers": len(subscriptions),
+                "published": self.published,
+                "duplicates": self.duplicates,
+                "buffered": sum(s.depth() for s in subscriptions),
+                "dropped": self.dropped,
+            }
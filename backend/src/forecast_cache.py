@@ -0,0 +1,102 @@
+import os
+import time
+import threading
+from cachetools import TTLCache
+from firebase_admin import firestore
+from hotspots import hotspot_arrays
+
+FORECAST_CACHE_SIZE = int(os.getenv("FORECAST_CACHE_SIZE", 512))
+FORECAST_CACHE_TTL = int(os.getenv("FORECAST_CACHE_TTL", 6 * 60 * 60))
+# How often each process checks whether forecasts were regenerated elsewhere
+FORECAST_VERSION_CHECK_SECONDS = int(os.getenv("FORECAST_VERSION_CHECK_SECONDS", 60))
+
+_MISSING = object()
+_cache = TTLCache(maxsize=FORECAST_CACHE_SIZE, ttl=FORECAST_CACHE_TTL)
+_lock = threading.Lock()
+_version = None
+_last_version_check = 0.0
+
+
+class ForecastEntry:
+    """A topHotspots document with its coordinates and scores held as read-only arrays."""
+    __slots__ = ("hotspots", "lats", "lons", "scores")
+
+    def __init__(self, hotspots):
+        self.hotspots = tuple(hotspots)
+        self.lats, self.lons, self.scores = hotspot_arrays(self.hotspots)
+        for array in (self.lats, self.lons, self.scores):
+            array.setflags(write=False)
+
+
+def _version_ref(db):
+    return db.collection("forecastMeta").document("cache")
+
+
+def _check_version(db):
+    """Drop every cached forecast if another process bumped the forecast version."""
+    global _version, _last_version_check
+    now = time.monotonic()
+    with _lock:
+        if now - _last_version_check < FORECAST_VERSION_CHECK_SECONDS:
+            return
+        _last_version_check = now
+
+    try:
+        snapshot = _version_ref(db).get()
+    except Exception as e:
+        print(f"Forecast version check failed: {str(e)}")
+        return
+    version = (snapshot.to_dict() or {}).get("version") if snapshot.exists else None
+
+    with _lock:
+        if version != _version:
+            _cache.clear()
+            _version = version
+
+
+def get_forecast(db, bird, month):
+    """
+    Read-through lookup of forecasts/{bird}/topHotspots/{month}.
+    Returns None when the document does not exist.
+    """
+    _check_version(db)
+    key = (bird, str(month))
+    with _lock:
+        entry = _cache.get(key, _MISSING)
+    if entry is not _MISSING:
+        return entry
+
+    snapshot = (
+        db.collection("forecasts")
+          .document(bird)
+          .collection("topHotspots")
+          .document(str(month))
+          .get()
+    )
+    entry = None
+    if snapshot.exists:
+        entry = ForecastEntry((snapshot.to_dict() or {}).get("topHotspots") or [])
+
+    with _lock:
+        _cache[key] = entry
+    return entry
+
+
+def invalidate_forecasts(bird=None, month=None):
+    """Drop cached forecasts in this process: everything, one bird, or one bird/month."""
+    with _lock:
+        if bird is None:
+            _cache.clear()
+            return
+        for key in list(_cache.keys()):
+            if key[0] == bird and (month is None or key[1] == str(month)):
+                _cache.pop(key, None)
+
+
+def bump_forecast_version(db):
+    """Tell every process to drop its cached forecasts on its next version check."""
+    _version_ref(db).set({
+        "version": firestore.Increment(1),
+        "updatedAt": firestore.SERVER_TIMESTAMP
+    }, merge=True)
+    invalidate_forecasts()
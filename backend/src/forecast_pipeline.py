@@ -0,0 +1,298 @@
+import os
+import re
+import time
+import argparse
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+from firebase_admin import firestore
+from detection_export import iter_detection_pages
+from forecast_cache import bump_forecast_version
+
+CELL_DEGREES = float(os.getenv("FORECAST_CELL_DEGREES", 0.1))
+TOP_N = int(os.getenv("FORECAST_TOP_N", 25))
+PAGE_SIZE = 5000
+WRITE_BATCH_SIZE = 400
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# forecasts/{key} documents the app already asks for
+FORECAST_KEYS = {
+    "American Robin": "robin",
+    "Blue Jay": "blue-jays",
+    "Turkey Vulture": "turkey-vultures",
+    "Canada Goose": "canada-geese",
+    "Canvasback": "canvasbacks",
+    "Common Grackle": "common-grackles",
+    "European Starling": "european-starlings",
+    "Mallard": "mallards",
+    "Red-winged Blackbird": "redwinged-blackbirds",
+    "Ring-billed Gull": "ringbilled-gulls",
+    "Tree Swallow": "tree-swallows",
+    "American Crow": "american-crows",
+}
+
+
+def forecast_key(bird):
+    return FORECAST_KEYS.get(bird) or re.sub(r"[^a-z0-9]+", "-", bird.lower()).strip("-")
+
+
+def _state_ref(db):
+    return db.collection("forecastPipeline").document("state")
+
+
+def _grid_ref(db, key, month):
+    return db.collection("forecasts").document(key).collection("gridCells").document(str(month))
+
+
+def _cell_ref(db, key, month, cell_id):
+    return _grid_ref(db, key, month).collection("cells").document(cell_id)
+
+
+def _empty_grid(bird):
+    # days holds every day (YYYYMMDD) the species was seen that month; top the ids of its best cells
+    return {"bird": bird, "days": set(), "top": [], "cells": {}, "touched": set(), "dirty": False}
+
+
+def _empty_cell():
+    return {"detections": 0, "days": set(), "latSum": 0.0, "lonSum": 0.0, "watermark": EPOCH, "floor": EPOCH}
+
+
+def _grid_from_doc(data):
+    if "top" not in data:
+        raise ValueError(f"Grid for {data.get('bird')} is in an old format; rebuild it with --full")
+    return {**_empty_grid(data["bird"]), "days": set(data["days"]), "top": list(data["top"])}
+
+
+def _cell_from_doc(data):
+    # Pages aren't in write order on a full read, so rows are compared against the watermark as loaded
+    return {**data, "days": set(data["days"]), "floor": data["watermark"]}
+
+
+def _cell_doc(cell):
+    return {
+        "detections": cell["detections"],
+        "days": sorted(cell["days"]),
+        "latSum": cell["latSum"],
+        "lonSum": cell["lonSum"],
+        "watermark": cell["watermark"],
+    }
+
+
+def fold_page(rows, grids, load_grid, load_cells):
+    """
+    Bin one page of detections, in any order, into per-species, per-month
+    grid cells. `grids` maps (key, month) to grid dicts and is updated in
+    place; `load_grid(key, month, bird)` supplies grids not seen yet and
+    `load_cells(key, month, cell_ids)` the stored cells of those ids.
+    Watermarks are on `createdAt`, the write time, because a detection's
+    `timestamp` can be earlier than detections already folded in.
+    Returns the newest write time in the page.
+    """
+    df = pd.DataFrame.from_records(rows, columns=["bird", "latitude", "longitude", "timestamp", "createdAt"])
+    df = df.dropna(subset=["bird", "latitude", "longitude", "timestamp"])
+    if df.empty:
+        return None
+
+    df["ts"] = pd.to_datetime(df["timestamp"], utc=True)
+    # Detections written before createdAt existed only turn up in --full rebuilds
+    df["created"] = pd.to_datetime(df["createdAt"], utc=True).fillna(df["ts"])
+    local = df["ts"].dt.tz_convert("US/Eastern")
+    keys = {bird: forecast_key(bird) for bird in df["bird"].unique()}
+    df["key"] = df["bird"].map(keys)
+    df["month"] = local.dt.month
+    df["day"] = local.dt.year * 10000 + local.dt.month * 100 + local.dt.day
+    df["row"] = np.floor((df["latitude"].astype(float) + 90) / CELL_DEGREES).astype(int)
+    df["col"] = np.floor((df["longitude"].astype(float) + 180) / CELL_DEGREES).astype(int)
+    df["cell"] = df["row"].astype(str) + ":" + df["col"].astype(str)
+    newest = df["created"].max().to_pydatetime()
+
+    for key, month, bird in df[["key", "month", "bird"]].drop_duplicates(["key", "month"]).itertuples(index=False):
+        if (key, month) not in grids:
+            grids[(key, month)] = load_grid(key, int(month), bird)
+
+    # Only the cells this page touches are read, not the whole grid
+    for (key, month), cell_ids in df.groupby(["key", "month"])["cell"].unique().items():
+        grid = grids[(key, month)]
+        missing = [cell_id for cell_id in cell_ids if cell_id not in grid["cells"]]
+        if missing:
+            stored = load_cells(key, int(month), missing)
+            for cell_id in missing:
+                grid["cells"][cell_id] = stored.get(cell_id) or _empty_cell()
+
+    # Days are a set, so they can be added before the cell watermarks are checked. The grid is
+    # rewritten even if every row turns out to be folded in already, in case a previous run was
+    # cut off after writing the cells but before the grid
+    for (key, month), days in df.groupby(["key", "month"])["day"].unique().items():
+        grid = grids[(key, month)]
+        grid["days"].update(int(day) for day in days)
+        grid["dirty"] = True
+
+    # Skip anything a previous, partially written run already folded in
+    floors = pd.Series(
+        [grids[(key, month)]["cells"][cell]["floor"] for key, month, cell in zip(df["key"], df["month"], df["cell"])],
+        index=df.index
+    )
+    df = df[df["created"] > pd.to_datetime(floors, utc=True)]
+    if df.empty:
+        return newest
+
+    cells = df.groupby(["key", "month", "cell"], sort=True).agg(
+        count=("ts", "size"), days=("day", "unique"), lat_sum=("latitude", "sum"), lon_sum=("longitude", "sum"),
+        latest=("created", "max")
+    )
+    for (key, month, cell_id), count, days, lat_sum, lon_sum, latest in cells.itertuples(name=None):
+        grid = grids[(key, month)]
+        cell = grid["cells"][cell_id]
+        cell["detections"] += int(count)
+        cell["days"].update(int(day) for day in days)
+        cell["latSum"] += float(lat_sum)
+        cell["lonSum"] += float(lon_sum)
+        cell["watermark"] = max(cell["watermark"], latest.to_pydatetime())
+        grid["touched"].add(cell_id)
+
+    return newest
+
+
+def top_cells(grid, top_n=TOP_N):
+    """
+    The ids of the grid's best `top_n` cells with their reliability_score,
+    the share of the species' observed days that month with a detection in
+    the cell. Ties go to the cell with more detections.
+
+    Only the previous top cells and the ones touched since are in memory.
+    That is enough: cells only ever gain days and detections, so an untouched
+    cell that wasn't in the top can't have overtaken one that was.
+    """
+    cell_ids = list(grid["cells"])
+    if not cell_ids or not grid["days"]:
+        return []
+
+    cells = [grid["cells"][cell_id] for cell_id in cell_ids]
+    stats = np.array([(cell["detections"], len(cell["days"])) for cell in cells], dtype=np.float64)
+    scores = stats[:, 1] / len(grid["days"])
+    order = np.lexsort((-stats[:, 0], -scores))[:top_n]
+    return [(cell_ids[i], float(scores[i])) for i in order]
+
+
+def rank_cells(grid, top_n=TOP_N):
+    """Turn a grid into topHotspots entries."""
+    hotspots = []
+    for cell_id, score in top_cells(grid, top_n):
+        cell = grid["cells"][cell_id]
+        count = cell["detections"]
+        lat, lon = cell["latSum"] / count, cell["lonSum"] / count
+        hotspots.append({
+            "location": f"{lat:.3f}, {lon:.3f}",
+            "lat": lat,
+            "lon": lon,
+            "reliability_score": round(score, 3),
+            "detections": int(count),
+            "days": len(cell["days"]),
+        })
+    return hotspots
+
+
+def run_pipeline(db, full=False, page_size=PAGE_SIZE):
+    """
+    Fold detections written since the stored watermark (or all of them with
+    `full`) into the grids and rewrite topHotspots for every species/month
+    that changed.
+
+    Each species/month keeps a small gridCells/{month} document (its observed
+    days and top cell ids) and one document per cell under it, so no single
+    document grows with a species' range and only touched cells are rewritten.
+    """
+    started = time.monotonic()
+    state = _state_ref(db).get()
+    # Without a watermark every detection is read, including any without createdAt
+    since = None
+    if not full and state.exists:
+        since = state.to_dict().get("watermark")
+
+    def load_cells(key, month, cell_ids):
+        if full:
+            return {}
+        refs = [_cell_ref(db, key, month, cell_id) for cell_id in cell_ids]
+        return {snapshot.id: _cell_from_doc(snapshot.to_dict()) for snapshot in db.get_all(refs) if snapshot.exists}
+
+    def load_grid(key, month, bird):
+        if full:
+            return _empty_grid(bird)
+        snapshot = _grid_ref(db, key, month).get()
+        if not snapshot.exists:
+            return _empty_grid(bird)
+        grid = _grid_from_doc(snapshot.to_dict())
+        # The previous top cells are ranked again alongside the ones this run touches
+        grid["cells"] = load_cells(key, month, grid["top"])
+        return grid
+
+    grids = {}
+    watermark = since or EPOCH
+    detections = 0
+    for rows in iter_detection_pages(db, page_size=page_size, since=since):
+        detections += len(rows)
+        newest = fold_page(rows, grids, load_grid, load_cells)
+        if newest is not None and newest > watermark:
+            watermark = newest
+
+    batch = db.batch()
+    pending = 0
+    updated = 0
+
+    def queue_write(ref, data):
+        nonlocal batch, pending
+        batch.set(ref, data)
+        pending += 1
+        if pending >= WRITE_BATCH_SIZE:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+
+    for (key, month), grid in grids.items():
+        if not grid["dirty"]:
+            continue
+        # Each cell carries its own watermark, so a run cut off partway through is safe to repeat
+        for cell_id in grid["touched"]:
+            queue_write(_cell_ref(db, key, month, cell_id), _cell_doc(grid["cells"][cell_id]))
+        top = top_cells(grid)
+        queue_write(_grid_ref(db, key, month), {
+            "bird": grid["bird"], "days": sorted(grid["days"]), "top": [cell_id for cell_id, _ in top]
+        })
+        queue_write(
+            db.collection("forecasts").document(key).collection("topHotspots").document(str(month)),
+            {"bird": grid["bird"], "topHotspots": rank_cells(grid), "updatedAt": firestore.SERVER_TIMESTAMP}
+        )
+        updated += 1
+    if pending:
+        batch.commit()
+
+    # Only advance the watermark once every grid is safely written
+    _state_ref(db).set({"watermark": watermark, "updatedAt": firestore.SERVER_TIMESTAMP}, merge=True)
+    if updated:
+        bump_forecast_version(db)
+
+    return {
+        "detections": detections,
+        "forecasts_updated": updated,
+        "watermark": watermark,
+        "seconds": round(time.monotonic() - started, 2),
+    }
+
+
+if __name__ == "__main__":
+    import firebase_admin
+    from firebase_admin import credentials
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Precompute forecasts/{bird}/topHotspots/{month} from the birds collection.")
+    parser.add_argument("--full", action="store_true", help="Ignore the watermark and rebuild every grid from scratch")
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE)
+    args = parser.parse_args()
+
+    cred_path = os.getenv("FIREBASE_ADMIN_CREDENTIALS", "backend/secrets/firebase-admin-key.json")
+    firebase_admin.initialize_app(credentials.Certificate(cred_path))
+
+    result = run_pipeline(firestore.client(), full=args.full, page_size=args.page_size)
+    print(f"Processed {result['detections']} detections, updated {result['forecasts_updated']} forecasts "
+          f"in {result['seconds']}s (watermark {result['watermark'].isoformat()}).")
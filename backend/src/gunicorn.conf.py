@@ -0,0 +1,49 @@
+# Pre-fork serving: load the app, BirdNET and its species tables once in the
+# gunicorn master, then fork workers that share those pages copy-on-write.
+#
+#     cd backend/src && gunicorn server:app
+#
+# Nothing in the master may touch Firestore or start threads: gRPC channels
+# and threads don't survive fork. Background services start in post_fork.
+import gc
+import os
+import glob
+import tempfile
+
+os.environ["ROBIN_PREFORK"] = "1"
+# Workers share their metrics through this directory, so any worker can answer a scrape for all of them
+os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), "robin-metrics"))
+preload_app = os.getenv("PRELOAD_APP", "1") == "1"
+if preload_app:
+    os.environ.setdefault("BIRDNET_WARMUP", "sync")
+
+bind = os.getenv("BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", 4))
+# Threads keep SSE streams from tying up a whole worker
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 8))
+timeout = 120
+
+
+def on_starting(server):
+    # Counters restart from zero with the server, so drop what the last run left behind
+    os.makedirs(os.environ["METRICS_DIR"], exist_ok=True)
+    for path in glob.glob(os.path.join(os.environ["METRICS_DIR"], "*.json")):
+        os.remove(path)
+
+
+def when_ready(server):
+    # Move everything loaded so far out of the collector's reach, so garbage
+    # collection in the workers doesn't write to (and copy) the shared pages
+    if preload_app:
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    import server as app_module
+    app_module.start_background_services()
+
+
+def child_exit(server, worker):
+    from metrics import mark_process_dead
+    mark_process_dead(worker.pid)
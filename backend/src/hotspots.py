@@ -0,0 +1,80 @@
+import math
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+KM_TO_MILES = 0.621371
+MAX_HOTSPOTS = 50
+
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    """
+    Calculate distance in KM between two lat/lon points using Haversine.
+    We'll convert to miles below if we want that.
+    """
+    R = EARTH_RADIUS_KM
+    d_lat = math.radians(lat2 - lat1)
+    d_lon = math.radians(lon2 - lon1)
+    a = (math.sin(d_lat / 2) ** 2 +
+         math.cos(math.radians(lat1)) *
+         math.cos(math.radians(lat2)) *
+         math.sin(d_lon / 2) ** 2)
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return R * c
+
+
+def haversine_distances(lat, lon, lats, lons):
+    """Distance in KM from one point to every point in the `lats`/`lons` arrays."""
+    lat1 = np.radians(lat)
+    lats2 = np.radians(lats)
+    d_lat = lats2 - lat1
+    d_lon = np.radians(lons) - np.radians(lon)
+    a = np.sin(d_lat / 2) ** 2 + np.cos(lat1) * np.cos(lats2) * np.sin(d_lon / 2) ** 2
+    a = np.clip(a, 0.0, 1.0)
+    return EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def hotspot_arrays(hotspots):
+    """Pull lat, lon and reliability_score out of hotspot dicts into float arrays."""
+    lats = np.fromiter((h["lat"] for h in hotspots), dtype=np.float64, count=len(hotspots))
+    lons = np.fromiter((h["lon"] for h in hotspots), dtype=np.float64, count=len(hotspots))
+    scores = np.fromiter((h["reliability_score"] for h in hotspots), dtype=np.float64, count=len(hotspots))
+    return lats, lons, scores
+
+
+def _smallest_k(values, k):
+    """Indices of the k smallest values, plus anything tied with the k-th so ties can be broken later."""
+    if k >= len(values):
+        return np.arange(len(values))
+    kth = np.partition(values, k - 1)[k - 1]
+    return np.flatnonzero(values <= kth)
+
+
+def top_hotspots(hotspots, lats, lons, scores, user_lat=None, user_lon=None, k=1):
+    """
+    Return the k best hotspots as new dicts, leaving `hotspots` untouched.
+    With a location they are ranked nearest first (higher reliability breaks
+    ties) and carry `distance_miles`; without one, by reliability_score.
+    """
+    if not len(hotspots) or k < 1:
+        return []
+
+    order = np.arange(len(hotspots))
+    if user_lat is not None and user_lon is not None:
+        distances = haversine_distances(user_lat, user_lon, lats, lons) * KM_TO_MILES
+        candidates = _smallest_k(distances, k)
+        ranked = candidates[np.lexsort((order[candidates], -scores[candidates], distances[candidates]))][:k]
+        return [{**hotspots[i], "distance_miles": float(distances[i])} for i in ranked]
+
+    candidates = _smallest_k(-scores, k)
+    ranked = candidates[np.lexsort((order[candidates], -scores[candidates]))][:k]
+    return [dict(hotspots[i]) for i in ranked]
+
+
+def hotspots_within(hotspots, lats, lons, user_lat, user_lon, radius_miles, k=MAX_HOTSPOTS):
+    """Hotspots within `radius_miles` of the user, nearest first, at most k of them."""
+    if not len(hotspots):
+        return []
+    distances = haversine_distances(user_lat, user_lon, lats, lons) * KM_TO_MILES
+    inside = np.flatnonzero(distances <= radius_miles)
+    inside = inside[np.argsort(distances[inside], kind="stable")][:k]
+    return [{**hotspots[i], "distance_miles": float(distances[i])} for i in inside]
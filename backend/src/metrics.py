@@ -0,0 +1,280 @@
+import os
+import glob
+import json
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Seconds; covers per-chunk FFTs up to slow uploads and LLM calls
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# With several worker processes, each writes its metrics here and a scrape of any one reports them all
+METRICS_DIR = os.getenv("METRICS_DIR")
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", 5))
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = [
+        (name, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for name, value in pairs
+    ]
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    """
+    Metrics of this process, rendered in the Prometheus text format. Metrics
+    with no samples yet are left out, so the output of two processes can be
+    concatenated as long as the metrics they have recorded have different names.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+
+    def collect(self):
+        """A plain-data snapshot of every metric, as written for other processes to merge."""
+        with self._lock:
+            metrics = list(self._metrics)
+        return [metric.collect() for metric in metrics]
+
+    def render(self):
+        return "".join(_render_metric(metric) for metric in self.collect())
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    """Base for counters and gauges. Given `fn`, the unlabelled value is read from `fn()` at render time instead."""
+    kind = None
+
+    def __init__(self, name, description, labelnames=(), registry=REGISTRY, fn=None):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self.fn = fn
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _key(self, labelvalues):
+        if len(labelvalues) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return tuple(str(value) for value in labelvalues)
+
+    def _samples(self):
+        if self.fn is not None:
+            try:
+                return [((), self.fn())]
+            except Exception:
+                return []
+        with self._lock:
+            return sorted(self._values.items())
+
+    def collect(self):
+        return {
+            "name": self.name, "kind": self.kind, "description": self.description,
+            "labelnames": list(self.labelnames), "samples": [[list(key), value] for key, value in self._samples()],
+        }
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labelvalues, amount=1):
+        key = self._key(labelvalues)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, *labelvalues):
+        key = self._key(labelvalues)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, description, labelnames=(), registry=REGISTRY, buckets=LATENCY_BUCKETS):
+        super().__init__(name, description, labelnames, registry)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labelvalues):
+        key = self._key(labelvalues)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, *labelvalues):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labelvalues)
+
+    def collect(self):
+        with self._lock:
+            samples = sorted((key, [[*counts], total, count]) for key, (counts, total, count) in self._values.items())
+        return {
+            "name": self.name, "kind": self.kind, "description": self.description,
+            "labelnames": list(self.labelnames), "buckets": list(self.buckets),
+            "samples": [[list(key), value] for key, value in samples],
+        }
+
+
+def _render_metric(metric):
+    """Prometheus text for one collected metric; empty if it has no samples."""
+    name, labelnames, samples = metric["name"], metric["labelnames"], metric["samples"]
+    if not samples:
+        return ""
+    lines = [f"# HELP {name} {metric['description']}\n# TYPE {name} {metric['kind']}\n"]
+    for key, value in samples:
+        if metric["kind"] != "histogram":
+            lines.append(f"{name}{_format_labels(labelnames, key)} {_format_value(value)}\n")
+            continue
+        counts, total, count = value
+        cumulative = 0
+        for bound, bucket_count in zip(metric["buckets"] + [float("inf")], counts):
+            cumulative += bucket_count
+            labels = _format_labels(labelnames, key, [("le", _format_value(float(bound)))])
+            lines.append(f"{name}_bucket{labels} {cumulative}\n")
+        labels = _format_labels(labelnames, key)
+        lines.append(f"{name}_sum{labels} {_format_value(total)}\n")
+        lines.append(f"{name}_count{labels} {count}\n")
+    return "".join(lines)
+
+
+def _process_file(pid):
+    return os.path.join(METRICS_DIR, f"{pid}.json")
+
+
+def write_process_metrics(registry=REGISTRY):
+    """Save this process's metrics to METRICS_DIR for the other workers' scrapes."""
+    data = {"pid": os.getpid(), "live": True, "metrics": registry.collect()}
+    path = _process_file(os.getpid())
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    # Replaced in one step, so a reader never sees half a file
+    os.replace(path + ".tmp", path)
+
+
+def mark_process_dead(pid):
+    """
+    Keep an exited worker's counters and histograms, so totals don't drop
+    when a worker restarts, but stop reporting its gauges.
+    """
+    path = _process_file(pid)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return
+    data["live"] = False
+    data["metrics"] = [metric for metric in data["metrics"] if metric["kind"] != "gauge"]
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(path + ".tmp", path)
+
+
+def _merge(processes):
+    """
+    Sum counters and histograms across processes. Gauges describe one
+    process's state, so they're kept apart with a `worker` label.
+    """
+    merged = {}
+    for data in processes:
+        for metric in data["metrics"]:
+            gauge = metric["kind"] == "gauge"
+            target = merged.get(metric["name"])
+            if target is None:
+                target = merged[metric["name"]] = {
+                    **metric, "labelnames": metric["labelnames"] + (["worker"] if gauge else []), "samples": {}
+                }
+            for key, value in metric["samples"]:
+                key = tuple(key) + ((str(data["pid"]),) if gauge else ())
+                current = target["samples"].get(key)
+                if current is None or gauge:
+                    target["samples"][key] = value
+                elif metric["kind"] == "histogram":
+                    target["samples"][key] = [
+                        [a + b for a, b in zip(current[0], value[0])], current[1] + value[1], current[2] + value[2]
+                    ]
+                else:
+                    target["samples"][key] = current + value
+    for metric in merged.values():
+        metric["samples"] = sorted(metric["samples"].items())
+    return list(merged.values())
+
+
+def render_all(registry=REGISTRY):
+    """
+    This process's metrics, or with METRICS_DIR set, those of every worker
+    that has written there, merged. Other workers' numbers are up to
+    METRICS_FLUSH_SECONDS old.
+    """
+    if not METRICS_DIR:
+        return registry.render()
+    write_process_metrics(registry)
+    processes = []
+    for path in glob.glob(os.path.join(METRICS_DIR, "*.json")):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                processes.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return "".join(_render_metric(metric) for metric in _merge(processes))
+
+
+def _write_forever(registry):
+    while True:
+        try:
+            write_process_metrics(registry)
+        except Exception as e:
+            print(f"Error writing metrics: {str(e)}")
+        time.sleep(METRICS_FLUSH_SECONDS)
+
+
+def start_metrics_writer(registry=REGISTRY):
+    """Write this process's metrics to METRICS_DIR every METRICS_FLUSH_SECONDS (only when METRICS_DIR is set)."""
+    global _writer
+    if not METRICS_DIR:
+        return
+    with _writer_lock:
+        if _writer is None:
+            os.makedirs(METRICS_DIR, exist_ok=True)
+            _writer = threading.Thread(target=_write_forever, args=(registry,), name="metrics-writer", daemon=True)
+            _writer.start()
+
+
+# Stages timed in the web server; the detection service reports its own as robin_detector_*
+STAGE_SECONDS = Histogram(
+    "robin_stage_seconds",
+    "Time spent in each processing stage (decode, noise_gate, birdnet_inference, firestore_write, audubon_fetch, llm_call).",
+    ["stage"]
+)
@@ -0,0 +1,89 @@
+import os
+import sys
+import time
+import uuid
+import threading
+from collections import Counter
+
+PROFILE_INTERVAL_SECONDS = float(os.getenv("PROFILE_INTERVAL_MS", 5)) / 1000
+# Shared by every worker on the host, so a profile can be fetched from any of them
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join("/tmp", "robin-profiles"))
+MAX_PROFILE_SECONDS = 120
+
+
+class SamplingProfiler:
+    """
+    Samples the Python stacks of chosen threads every PROFILE_INTERVAL_SECONDS
+    from a background thread, using sys._current_frames(), so the code being
+    profiled runs unmodified. Output is in the collapsed-stack format read by
+    flamegraph.pl and speedscope: one "outer;...;inner count" line per stack.
+    """
+
+    def __init__(self, thread_ids, interval=PROFILE_INTERVAL_SECONDS):
+        self.thread_ids = set(thread_ids)
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.collapsed()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id in self.thread_ids:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self.samples[_stack(frame)] += 1
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+def _stack(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def profile_for(thread_ids, seconds):
+    """Sample the given threads for `seconds` (capped at MAX_PROFILE_SECONDS) and return the collapsed stacks."""
+    profiler = SamplingProfiler(thread_ids).start()
+    time.sleep(min(seconds, MAX_PROFILE_SECONDS))
+    return profiler.stop()
+
+
+def new_profile_id():
+    return uuid.uuid4().hex
+
+
+def save_profile(collapsed, profile_id=None):
+    """Write a profile to PROFILE_DIR and return its id."""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profile_id = profile_id or new_profile_id()
+    with open(os.path.join(PROFILE_DIR, f"{profile_id}.txt"), "w", encoding="utf-8") as f:
+        f.write(collapsed)
+    return profile_id
+
+
+def load_profile(profile_id):
+    """A saved profile's collapsed stacks, or None if there is no such profile."""
+    if not profile_id.isalnum():
+        return None
+    path = os.path.join(PROFILE_DIR, f"{profile_id}.txt")
+    if not os.path.isfile(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
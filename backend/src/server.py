@@ -1,48 +1,56 @@
 import os
-import logging
+import time
+from warmup import (
+    BIRDNET_WARMUP, timed_phase, mark_started, start_warmup, get_analyzer, analysis_lock, startup_report
+)
 import wave
 import numpy as np
 from datetime import datetime, timedelta
 from pytz import timezone
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, Response, stream_with_context, g
 from flask_cors import CORS
 from firebase_admin import credentials, firestore, initialize_app, auth
 import firebase_admin
 import bcrypt
-import psutil
-import signal
-import subprocess
+import threading
 import werkzeug
-from pydub import AudioSegment
-from birdnetlib import Recording
-from birdnetlib.analyzer import Analyzer
 import json
-from bs4 import BeautifulSoup
 import requests
-from openai import OpenAI
 from dotenv import load_dotenv
 load_dotenv()
 import random
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-import math
 from functools import wraps
 from flask import session, jsonify
-from flask_session import Session
 from flask import Flask, request
+from detection_summaries import record_detections, get_summary
+from detection_export import EXPORT_FORMATS, iter_export
+from detection_aggregator import DetectionAggregator
+from hotspots import MAX_HOTSPOTS, top_hotspots, hotspots_within
+from detection_feed import DetectionFeed
+from event_bus import EventBus
+from metrics import STAGE_SECONDS, Counter, Gauge, Histogram, render_all, start_metrics_writer
+from profiler import SamplingProfiler, new_profile_id, save_profile, load_profile
+from chat_completion import complete, stream_completion, get_openai_client
+from chat_cache import AnswerCache
+from deletion_worker import DeletionWorker
+from detection_service import DetectionServiceClient
+from session_store import configure_sessions, start_session_sweeper
+from chat_store import (
+    get_chat_owner, remember_chat_owner, forget_chat, add_exchange, messages_ref,
+    page_messages, page_chats, refresh_last_message
+)
+from forecast_cache import get_forecast, bump_forecast_version
+
+# pydub, BeautifulSoup, BirdNET and OpenAI are imported where they're first needed
+mark_started("imports")
 
 app = Flask(__name__)
 
 app.secret_key = os.getenv("FLASK_SECRET_KEY")
 
-app.config["SESSION_TYPE"] = "filesystem"
-app.config["SESSION_PERMANENT"] = True
-app.config["SESSION_USE_SIGNER"] = True
 app.permanent_session_lifetime = timedelta(days=30)
 
-
-Session(app)
-
 CORS(app, supports_credentials=True)
 
 def login_required(f):
@@ -53,39 +61,109 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+ADMIN_USER_IDS = {uid.strip() for uid in os.getenv("ADMIN_USER_IDS", "").split(",") if uid.strip()}
+
+def is_admin(user_id):
+    return user_id in ADMIN_USER_IDS
+
 cred_path = os.getenv("FIREBASE_ADMIN_CREDENTIALS")
 if not cred_path or not os.path.isfile(cred_path):
     raise FileNotFoundError(f"Firebase credentials file not found at: {cred_path}")
 
-cred = credentials.Certificate(cred_path)
-
-initialize_app(cred)
-db = firestore.client()
+with timed_phase("firebase_init"):
+    cred = credentials.Certificate(cred_path)
 
+    initialize_app(cred)
+    db = firestore.client()
 
-# BirdNET init
-analyzer = Analyzer()
-analyzer.verbose = False
-logging.getLogger("birdnetlib").setLevel(logging.ERROR)
+# Signed cookies by default; SESSION_BACKEND=firestore for revocable sessions shared by every instance
+configure_sessions(app, db)
 
 NOISE_FLOOR_THRESHOLD = 1e6
 ALPHA = 0.9
-is_running = False
-process = None  
 
-with open(os.path.join(os.path.dirname(__file__), "bird_data.json"), "r", encoding="utf-8") as file:
+# Live microphone detection runs in its own long-lived process, shared by every worker
+detection_service = DetectionServiceClient()
+
+# Purges chats and accounts off the request path
+deletion_worker = DeletionWorker(db)
+
+# Answers to repeated chat questions, keyed on the normalised question
+answer_cache = AnswerCache()
+
+# Recent detections for /nearby, loaded on first use
+detection_feed = DetectionFeed()
+MAX_NEARBY_MILES = 500
+
+# Live detections for /my-birds/stream
+detection_events = EventBus()
+EVENT_HEARTBEAT_SECONDS = int(os.getenv("EVENT_HEARTBEAT_SECONDS", 15))
+
+
+def detection_event(doc_id, data):
+    timestamp = data.get("timestamp")
+    return {
+        "id": doc_id,
+        "bird": data.get("bird"),
+        "latitude": data.get("latitude"),
+        "longitude": data.get("longitude"),
+        "timestamp": timestamp.isoformat() if timestamp else None,
+        "count": data.get("count", 1),
+        "maxConfidence": data.get("maxConfidence")
+    }
+
+
+def publish_feed_detection(doc_id, data):
+    """Relay detections written by the detection service or another worker to this worker's streams."""
+    if data.get("userId"):
+        detection_events.publish(data["userId"], doc_id, detection_event(doc_id, data))
+
+
+detection_feed.subscribe(publish_feed_detection)
+
+# Prometheus metrics for /metrics; stage timings are recorded into STAGE_SECONDS where the work happens
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+REQUEST_SECONDS = Histogram(
+    "robin_request_seconds",
+    "Request latency by route, method and status, up to the response headers.",
+    ["route", "method", "status"]
+)
+Gauge("robin_deletion_queue_depth", "Deletion jobs queued in this worker.", fn=deletion_worker.queue_depth)
+Gauge("robin_event_subscribers", "Open /my-birds/stream connections in this worker.",
+      fn=lambda: detection_events.stats()["subscribers"])
+Gauge("robin_event_buffered", "Events waiting in this worker's stream buffers.",
+      fn=lambda: detection_events.stats()["buffered"])
+Counter("robin_event_dropped_total", "Stream events dropped because a client fell behind.",
+        fn=lambda: detection_events.stats()["dropped"])
+
+
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    # Admins can profile a single request by sending "X-Profile: 1"
+    if request.headers.get("X-Profile") == "1" and is_admin(session.get("user_id")):
+        g.profiler = SamplingProfiler([threading.get_ident()]).start()
+
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        REQUEST_SECONDS.observe(time.perf_counter() - started, route, request.method, response.status_code)
+
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        # Stopped once the body is sent, so streamed responses are covered too
+        profile_id = new_profile_id()
+        response.headers["X-Profile-Id"] = profile_id
+        response.call_on_close(lambda: save_profile(profiler.stop(), profile_id))
+    return response
+
+with timed_phase("bird_data_load"), open(os.path.join(os.path.dirname(__file__), "bird_data.json"), "r", encoding="utf-8") as file:
     bird_data = json.load(file)
 
 
-def terminate_process_and_children(proc_pid):
-    try:
-        parent = psutil.Process(proc_pid)
-        for child in parent.children(recursive=True):
-            child.terminate()
-        parent.terminate()
-    except psutil.NoSuchProcess:
-        pass
-
 @app.route('/bird-info', methods=['GET'])
 def get_bird_info():
     bird_name = request.args.get('bird')
@@ -104,8 +182,10 @@ def scrape_bird_info():
     if not url:
         return jsonify({"error": "URL is required"}), 400
     try:
-        response = requests.get(url)
-        response.raise_for_status()
+        from bs4 import BeautifulSoup
+        with STAGE_SECONDS.time("audubon_fetch"):
+            response = requests.get(url)
+            response.raise_for_status()
         soup = BeautifulSoup(response.content, "html.parser")
 
         # Extract description
@@ -277,10 +357,14 @@ def upload():
     raw_filename = werkzeug.utils.secure_filename(uploaded_file.filename)
     uploaded_file.save(raw_filename)
 
+    from pydub import AudioSegment
+    from birdnetlib import Recording
+
     wav_filename = "temp.wav"
     try:
-        audio_data = AudioSegment.from_file(raw_filename, format="m4a")
-        audio_data.export(wav_filename, format="wav")
+        with STAGE_SECONDS.time("decode"):
+            audio_data = AudioSegment.from_file(raw_filename, format="m4a")
+            audio_data.export(wav_filename, format="wav")
     except Exception as e:
         print("Error converting to WAV:", e)
         if os.path.exists(raw_filename):
@@ -292,13 +376,14 @@ def upload():
     lon = float(request.form.get('longitude', 0.0))
 
     # Noise-floor check
-    with wave.open(wav_filename, 'rb') as wf:
-        frames = wf.readframes(wf.getnframes())
-        audio_data_np = np.frombuffer(frames, dtype=np.int16)
+    with STAGE_SECONDS.time("noise_gate"):
+        with wave.open(wav_filename, 'rb') as wf:
+            frames = wf.readframes(wf.getnframes())
+            audio_data_np = np.frombuffer(frames, dtype=np.int16)
 
-    fft_data = np.fft.fft(audio_data_np)
-    power_spectrum = np.abs(fft_data) ** 2
-    max_power = np.max(power_spectrum)
+        fft_data = np.fft.fft(audio_data_np)
+        power_spectrum = np.abs(fft_data) ** 2
+        max_power = np.max(power_spectrum)
 
     if max_power < NOISE_FLOOR_THRESHOLD:
         NOISE_FLOOR_THRESHOLD = adjust_floor(NOISE_FLOOR_THRESHOLD, max_power, ALPHA)
@@ -309,26 +394,38 @@ def upload():
         })
     else:
 
-        recording = Recording(analyzer, wav_filename, lat=lat, lon=lon, date=datetime.now(), min_conf=0.25)
-        recording.analyze()
-        birds = list({item['common_name'] for item in recording.detections})
-
-        # Store to Firestore
+        recording = Recording(get_analyzer(), wav_filename, lat=lat, lon=lon, date=datetime.now(), min_conf=0.25)
+        with analysis_lock, STAGE_SECONDS.time("birdnet_inference"):
+            recording.analyze()
+        # One record per species heard, with its confidence and offsets into the recording
         eastern = timezone('US/Eastern')
         current_time = datetime.now().astimezone(eastern)
-        for bird in birds:
-            db.collection("birds").add({
-                "bird": bird,
-                "latitude": lat,
-                "longitude": lon,
-                "timestamp": current_time,
-                "userId": user_id
-            })
+        recording_started = current_time - timedelta(seconds=audio_data.duration_seconds)
+        aggregator = DetectionAggregator()
+        # A species heard again after a gap closes its earlier sighting, which has to be written too
+        closed = aggregator.add_detections(recording.detections, recording_started, lat, lon)
+        records = [sighting.to_record(user_id) for sighting in closed + aggregator.expire()]
+        # A species can have several records when it was heard again after a gap; list it once
+        birds = list(dict.fromkeys(record["bird"] for record in records))
+
+        # Store to Firestore together with the user's summary
+        with STAGE_SECONDS.time("firestore_write"):
+            doc_ids = record_detections(db, user_id, records)
+        for doc_id, record in zip(doc_ids, records):
+            detection_events.publish(user_id, doc_id, detection_event(doc_id, record))
 
         os.remove(wav_filename)
         return jsonify({
             "message": "File processed successfully",
-            "birds": birds
+            "birds": birds,
+            "detections": [{
+                "bird": record["bird"],
+                "count": record["count"],
+                "maxConfidence": record["maxConfidence"],
+                "meanConfidence": record["meanConfidence"],
+                "startOffset": record["startOffset"],
+                "endOffset": record["endOffset"]
+            } for record in records]
         })
 
 
@@ -349,43 +446,167 @@ def get_my_bird_history():
     return jsonify(user_birds), 200
 
 
-@app.route('/start-detection', methods=['POST'])
+@app.route("/my-birds/stream", methods=["GET"])
 @login_required
-def start_detection():
-    global is_running, process
-    if not is_running:
+def stream_my_birds():
+    """
+    Server-Sent Events feed of the user's new detections, from uploads and
+    the detection service. A comment line is sent every
+    EVENT_HEARTBEAT_SECONDS while idle. If this stream's buffer overflowed,
+    a `dropped` event tells the client to refetch /my-birds.
+    """
+    user_id = session["user_id"]
+    try:
+        detection_feed.ensure_started(db)
+    except Exception as e:
+        return jsonify({"error": f"Error opening detection stream: {str(e)}"}), 500
+    subscription = detection_events.subscribe(user_id)
+
+    def generate():
         try:
-            process = subprocess.Popen(["python", "detect_birds.py"])
-            is_running = True
-            print("Detection started.")
-            return jsonify({"message": "Bird detection started"})
-        except Exception as e:
-            print(f"Error starting detection: {str(e)}")
-            return jsonify({"message": f"Error starting detection: {str(e)}"}), 500
+            yield f"retry: {EVENT_HEARTBEAT_SECONDS * 1000}\n\n"
+            while not subscription.closed:
+                events, dropped = subscription.wait(EVENT_HEARTBEAT_SECONDS)
+                if dropped:
+                    yield sse_event({"dropped": dropped}, event="dropped")
+                for event in events:
+                    yield f"id: {event['id']}\n" + sse_event(event, event="detection")
+                if not events and not dropped:
+                    yield ": heartbeat\n\n"
+        finally:
+            detection_events.unsubscribe(subscription)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.route("/my-birds/summary", methods=["GET"])
+@login_required
+def get_my_bird_summary():
+    """Species counts, first/last seen and per-day histogram from the materialised summary."""
+    try:
+        return jsonify(get_summary(db, session["user_id"])), 200
+    except Exception as e:
+        return jsonify({"error": f"Error fetching summary: {str(e)}"}), 500
+
+
+@app.route("/export/detections", methods=["GET"])
+@login_required
+def export_detections():
+    """Stream the user's detections (or everyone's, for admins) as CSV, NDJSON or Parquet."""
+    fmt = request.args.get("format", "csv").lower()
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": f"Unsupported format. Use one of: {', '.join(sorted(EXPORT_FORMATS))}"}), 400
+
+    user_id = session["user_id"]
+    scope = request.args.get("scope", "mine")
+    if scope == "all":
+        if not is_admin(user_id):
+            return jsonify({"error": "Forbidden"}), 403
+        export_user = None
     else:
+        export_user = user_id
+
+    filename = f"detections-{'all' if export_user is None else export_user}.{fmt}"
+    return Response(
+        stream_with_context(iter_export(db, fmt, user_id=export_user)),
+        mimetype=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+
+@app.route('/start-detection', methods=['POST'])
+@login_required
+def start_detection():
+    try:
+        started = detection_service.start(session["user_id"])
+    except Exception as e:
+        print(f"Error starting detection: {str(e)}")
+        return jsonify({"message": f"Error starting detection: {str(e)}"}), 500
+    if not started:
         return jsonify({"message": "Bird detection is already running"}), 400
+    print("Detection started.")
+    return jsonify({"message": "Bird detection started"})
 
 @app.route('/stop-detection', methods=['POST'])
 @login_required
 def stop_detection():
-    global is_running, process
-    if is_running and process:
-        try:
-            terminate_process_and_children(process.pid)
-            process = None
-            is_running = False
-            print("Detection stopped.")
-            return jsonify({"message": "Bird detection stopped"})
-        except Exception as e:
-            print(f"Error stopping detection: {str(e)}")
-            return jsonify({"message": f"Error stopping detection: {str(e)}"}), 500
-    else:
+    try:
+        stopped = detection_service.stop()
+    except Exception as e:
+        print(f"Error stopping detection: {str(e)}")
+        return jsonify({"message": f"Error stopping detection: {str(e)}"}), 500
+    if not stopped:
         return jsonify({"message": "Bird detection is not running"}), 400
+    print("Detection stopped.")
+    return jsonify({"message": "Bird detection stopped"})
+
+@app.route('/detection/health', methods=['GET'])
+@login_required
+def detection_health():
+    """The detection service's run state and per-stage throughput."""
+    try:
+        health = detection_service.health()
+    except Exception as e:
+        return jsonify({"error": f"Error reading detection health: {str(e)}"}), 500
+    if health is None:
+        return jsonify({"running": False, "state": "down"}), 503
+    return jsonify(health)
+
+@app.route('/detection/profile', methods=['POST'])
+@login_required
+def profile_detection():
+    """Sample the running detector loop for ?seconds=N (default 10) and return collapsed stacks (admin only)."""
+    if not is_admin(session["user_id"]):
+        return jsonify({"error": "Admin access required"}), 403
+    seconds = max(1, min(request.args.get("seconds", 10, type=int), 120))
+    try:
+        collapsed = detection_service.profile(seconds)
+    except Exception as e:
+        return jsonify({"error": f"Error profiling detection: {str(e)}"}), 500
+    if collapsed is None:
+        return jsonify({"error": "Bird detection is not running"}), 409
+    return Response(collapsed, mimetype="text/plain")
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus metrics for the web server (every worker, with METRICS_DIR set), followed by the detection service's."""
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        return jsonify({"error": "Unauthorized"}), 401
+    body = render_all()
+    try:
+        body += detection_service.metrics()
+    except Exception as e:
+        print(f"Error reading detection service metrics: {str(e)}")
+    return Response(body, mimetype="text/plain; version=0.0.4")
+
+@app.route('/profiles/<profile_id>', methods=['GET'])
+@login_required
+def get_profile(profile_id):
+    """A profile saved from an "X-Profile: 1" request, as collapsed stacks (admin only)."""
+    if not is_admin(session["user_id"]):
+        return jsonify({"error": "Admin access required"}), 403
+    collapsed = load_profile(profile_id)
+    if collapsed is None:
+        return jsonify({"error": "Profile not found"}), 404
+    return Response(collapsed, mimetype="text/plain")
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness probe: 503 until BirdNET has finished loading. /status stays a liveness check."""
+    report = startup_report()
+    return jsonify(report), 200 if report["ready"] else 503
 
 @app.route('/status', methods=['GET'])
 def status():
-    global is_running
-    return jsonify({"running": is_running})
+    try:
+        running = detection_service.is_running()
+    except Exception:
+        running = False
+    return jsonify({"running": running})
 
 # Login, Register and Logout Endpoints
 @app.route('/register', methods=['POST'])
@@ -662,8 +883,10 @@ def create_chat():
             "userId": user_id,
             "title": title,
             "createdAt": firestore.SERVER_TIMESTAMP,
+            "updatedAt": firestore.SERVER_TIMESTAMP,
         }
         chat_ref = db.collection("chats").add(chat_data)
+        remember_chat_owner(chat_ref[1].id, user_id)
 
         return jsonify({"message": "Chat created", "chatId": chat_ref[1].id})
 
@@ -671,61 +894,47 @@ def create_chat():
         return jsonify({"error": f"Error creating chat: {str(e)}"}), 500
 
 
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def chat_access_error(chat_id):
+    """Error response if the chat is missing or isn't the session user's, otherwise None."""
+    owner = get_chat_owner(db, chat_id)
+    if owner is None:
+        return jsonify({"error": "Chat not found"}), 404
+    if owner != session["user_id"]:
+        return jsonify({"error": "Forbidden"}), 403
+    return None
+
+
 @app.route("/chats/<chat_id>/message", methods=["POST"])
 @login_required
 def send_message_to_chat(chat_id):
     """
-    Send a user message to ChatGPT and store the conversation.
+    Send a user message to ChatGPT and store the conversation. If the
+    completion fails, the question is stored on its own.
     """
     try:
-        chat_doc = db.collection("chats").document(chat_id).get()
-        if not chat_doc.exists:
-            return jsonify({"error": "Chat not found"}), 404
-
-        chat_data = chat_doc.to_dict()
-        if chat_data.get("userId") != session["user_id"]:
-            return jsonify({"error": "Forbidden"}), 403
+        error = chat_access_error(chat_id)
+        if error:
+            return error
 
         data = request.json
         user_message = data["message"]
+        asked_at = datetime.now(timezone('UTC'))
 
-        messages_ref = db.collection("chats").document(chat_id).collection("messages")
-        messages_ref.add({
-            "content": user_message,
-            "role": "user",
-            "sender": session["user_id"],   
-            "timestamp": firestore.SERVER_TIMESTAMP
-        })
-
-        system_prompt = (
-            "You are a birdwatching assistant answering with enthusiasm! You are roleplaying as the bird the user is asking about. "
-            "Keep your responses strictly 1-2 sentences long. Be concise but informative. "
-            "Do not tell the user that you are roleplaying or that you are pretending to be a bird. "
-            "Answer questions that are only related to birds. "
-            "If a question is outside bird-related topics, respond politely, mentioning that you only answer bird-related questions."
-        )
+        bot_message = answer_cache.get(user_message)
+        if bot_message is None:
+            try:
+                bot_message = complete(get_openai_client(), user_message)
+            except Exception:
+                # Keep the question even though there's no reply to store with it
+                add_exchange(db, chat_id, session["user_id"], user_message, None, asked_at)
+                raise
+            answer_cache.put(user_message, bot_message)
 
-        example_messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": "Are you a territorial species?"},
-            {"role": "assistant", "content": "Yes, I'm quite territorial! I'll fiercely defend my nesting area and food from other birds or animals who come too close!"},
-            {"role": "user", "content": "What does a Robin eat?"},
-            {"role": "assistant", "content": "My diet is diverse and includes tasty seeds, nuts, insects, and berries—anything nutritious I can find!"}
-        ]
-
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=example_messages + [{"role": "user", "content": user_message}],
-            max_tokens=75  
-        )
-        bot_message = response.choices[0].message.content
-
-        messages_ref.add({
-            "content": bot_message,
-            "role": "assistant",
-            "sender": "AI",
-            "timestamp": firestore.SERVER_TIMESTAMP
-        })
+        add_exchange(db, chat_id, session["user_id"], user_message, bot_message, asked_at)
 
         return jsonify({"botMessage": bot_message}), 200
 
@@ -733,24 +942,99 @@ def send_message_to_chat(chat_id):
         return jsonify({"error": f"Error sending message: {str(e)}"}), 500
 
 
-@app.route("/chats/<chat_id>/messages", methods=["GET"])
+def sse_event(data, event=None):
+    """Format one Server-Sent Event."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+@app.route("/chats/<chat_id>/message/stream", methods=["POST"])
 @login_required
-def get_chat_messages(chat_id):
+def stream_message_to_chat(chat_id):
+    """
+    Like /chats/<chat_id>/message, but relays the reply over SSE as it is
+    generated and stores both turns once it is complete. If the client
+    disconnects or the completion fails part way, the question and whatever
+    was streamed are stored, the reply marked partial.
+    """
     try:
-        from flask import session
+        error = chat_access_error(chat_id)
+        if error:
+            return error
 
-        chat_doc = db.collection("chats").document(chat_id).get()
-        if not chat_doc.exists():
-            return jsonify({"error": "Chat not found"}), 404
+        data = request.json
+        user_message = data["message"]
+        user_id = session["user_id"]
+        asked_at = datetime.now(timezone('UTC'))
+    except Exception as e:
+        return jsonify({"error": f"Error sending message: {str(e)}"}), 500
 
-        if chat_doc.to_dict().get("userId") != session["user_id"]:
-            return jsonify({"error": "Forbidden"}), 403
+    def generate():
+        parts = []
+        bot_message = None
+        finished = False
+        try:
+            bot_message = answer_cache.get(user_message)
+            if bot_message is not None:
+                yield sse_event({"token": bot_message})
+            else:
+                for token in stream_completion(get_openai_client(), user_message):
+                    parts.append(token)
+                    yield sse_event({"token": token})
+                bot_message = "".join(parts)
+                answer_cache.put(user_message, bot_message)
+
+            finished = True
+            add_exchange(db, chat_id, user_id, user_message, bot_message, asked_at)
+            yield sse_event({"botMessage": bot_message}, event="done")
+        except Exception as e:
+            yield sse_event({"error": f"Error sending message: {str(e)}"}, event="error")
+        finally:
+            # Also runs on GeneratorExit when the client disconnects mid-stream
+            if not finished:
+                try:
+                    if bot_message is None:
+                        add_exchange(db, chat_id, user_id, user_message, "".join(parts), asked_at, partial=True)
+                    else:
+                        add_exchange(db, chat_id, user_id, user_message, bot_message, asked_at)
+                except Exception as e:
+                    print(f"Error saving interrupted chat exchange: {str(e)}")
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
-        messages_ref = db.collection("chats").document(chat_id).collection("messages")
-        messages_snapshot = messages_ref.order_by("timestamp").stream()
-        messages = [{"messageId": msg.id, **msg.to_dict()} for msg in messages_snapshot]
 
-        return jsonify(messages), 200
+@app.route("/chats/<chat_id>/messages", methods=["GET"])
+@login_required
+def get_chat_messages(chat_id):
+    try:
+        error = chat_access_error(chat_id)
+        if error:
+            return error
+
+        # Without any paging parameter, keep returning the plain list of every message, like /chats
+        limit = request.args.get("limit", type=int)
+        before = request.args.get("before")
+        after = request.args.get("after")
+        if limit is None and not before and not after:
+            messages_snapshot = messages_ref(db, chat_id).order_by("timestamp").stream()
+            return jsonify([{"messageId": msg.id, **msg.to_dict()} for msg in messages_snapshot]), 200
+
+        limit = max(1, min(DEFAULT_PAGE_SIZE if limit is None else limit, MAX_PAGE_SIZE))
+        messages, has_more = page_messages(db, chat_id, limit, before=before, after=after)
+
+        # olderCursor pages back in history; newerCursor polls for new messages
+        return jsonify({
+            "messages": messages,
+            "hasMore": has_more,
+            "olderCursor": messages[0]["messageId"] if messages and has_more and not after else None,
+            "newerCursor": messages[-1]["messageId"] if messages else after
+        }), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": f"Error fetching messages: {str(e)}"}), 500
 
@@ -762,10 +1046,21 @@ def get_all_chats():
         from flask import session
         user_id = session["user_id"]
 
-        chats_ref = db.collection("chats").where("userId", "==", user_id).stream()
-        chat_list = [{"chatId": c.id, **c.to_dict()} for c in chats_ref]
+        # Without a limit, keep returning the plain list of every chat
+        limit = request.args.get("limit", type=int)
+        if limit is None:
+            chats_ref = db.collection("chats").where("userId", "==", user_id).stream()
+            chat_list = [{"chatId": c.id, **c.to_dict()} for c in chats_ref]
+            return jsonify(chat_list)
 
-        return jsonify(chat_list)
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        chat_list, has_more = page_chats(db, user_id, limit, cursor=request.args.get("cursor"))
+        return jsonify({
+            "chats": chat_list,
+            "nextCursor": chat_list[-1]["chatId"] if has_more else None
+        })
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": f"Error fetching chats: {str(e)}"}), 500
 
@@ -775,20 +1070,15 @@ def get_all_chats():
 def delete_chat(chat_id):
     """Delete a chat thread and its messages."""
     try:
-        from flask import session
-        chat_doc = db.collection("chats").document(chat_id).get()
-        if not chat_doc.exists:
-            return jsonify({"error": "Chat not found"}), 404
-
-        if chat_doc.to_dict().get("userId") != session["user_id"]:
-            return jsonify({"error": "Forbidden"}), 403
-
-        messages_ref = db.collection("chats").document(chat_id).collection("messages")
-        for msg in messages_ref.stream():
-            msg.reference.delete()
+        error = chat_access_error(chat_id)
+        if error:
+            return error
 
+        # The chat disappears right away; its messages are purged in the background
         db.collection("chats").document(chat_id).delete()
-        return jsonify({"message": "Chat deleted successfully"}), 200
+        forget_chat(chat_id)
+        job_id = deletion_worker.submit("chat", chat_id, session["user_id"])
+        return jsonify({"message": "Chat deleted successfully", "jobId": job_id}), 202
 
     except Exception as e:
         return jsonify({"error": f"Error deleting chat: {str(e)}"}), 500
@@ -798,81 +1088,82 @@ def delete_chat(chat_id):
 @login_required
 def delete_message(chat_id, message_id):
     try:
-        from flask import session
-        chat_doc = db.collection("chats").document(chat_id).get()
-        if not chat_doc.exists:
-            return jsonify({"error": "Chat not found"}), 404
+        error = chat_access_error(chat_id)
+        if error:
+            return error
 
-        if chat_doc.to_dict().get("userId") != session["user_id"]:
-            return jsonify({"error": "Forbidden"}), 403
-
-        db.collection("chats").document(chat_id).collection("messages").document(message_id).delete()
+        messages_ref(db, chat_id).document(message_id).delete()
+        refresh_last_message(db, chat_id, message_id)
         return jsonify({"message": "Message deleted successfully"}), 200
     except Exception as e:
         return jsonify({"error": f"Error deleting message: {str(e)}"}), 500
 
 
+BIRD_QUESTIONS = [
+    "What does a robin eat?",
+    "Where do robins build their nests?",
+    "How long do robins live?",
+    "Why do robins have red chests?",
+    "Do robins migrate in winter?",
+    "When do robins lay eggs?",
+    "How can I attract robins to my garden?",
+    "What sound does a robin make?",
+    "Are robins territorial birds?",
+    "How do robins find worms?",
+    "What predators do robins have?",
+    "Do male and female robins look different?",
+    "How many eggs do robins typically lay?",
+    "Do robins return to the same nest?",
+    "What birds stay active during winter?",
+    "How do birds navigate during migration?",
+    "What's the fastest flying bird?",
+    "How do birds sleep?",
+    "Why do birds sing in the morning?",
+    "How do birds stay warm in winter?",
+    "What's the difference between a hawk and a falcon?",
+    "How do hummingbirds hover?",
+    "Which birds are the best mimics?",
+    "What should I feed wild birds in my backyard?",
+    "How do birds communicate with each other?",
+    "What's the smartest bird species?",
+    "How do birds find their way home?",
+    "Why do birds flock together?",
+    "How do birds stay cool in summer?"
+]
+
+
 @app.route("/bird-questions", methods=["GET"])
 @login_required
 def get_bird_questions():
     """Return a set of random bird-related questions for chat suggestions."""
     try:
-        bird_questions = [
-            "What does a robin eat?",
-            "Where do robins build their nests?",
-            "How long do robins live?",
-            "Why do robins have red chests?",
-            "Do robins migrate in winter?",
-            "When do robins lay eggs?",
-            "How can I attract robins to my garden?",
-            "What sound does a robin make?",
-            "Are robins territorial birds?",
-            "How do robins find worms?",
-            "What predators do robins have?",
-            "Do male and female robins look different?",
-            "How many eggs do robins typically lay?",
-            "Do robins return to the same nest?",
-            "What birds stay active during winter?",
-            "How do birds navigate during migration?",
-            "What's the fastest flying bird?",
-            "How do birds sleep?",
-            "Why do birds sing in the morning?",
-            "How do birds stay warm in winter?",
-            "What's the difference between a hawk and a falcon?",
-            "How do hummingbirds hover?",
-            "Which birds are the best mimics?",
-            "What should I feed wild birds in my backyard?",
-            "How do birds communicate with each other?",
-            "What's the smartest bird species?",
-            "How do birds find their way home?",
-            "Why do birds flock together?",
-            "How do birds stay cool in summer?"
-        ]
-
         import random
-        selected_questions = random.sample(bird_questions, 4)
+        selected_questions = random.sample(BIRD_QUESTIONS, 4)
 
         return jsonify({"questions": selected_questions})
     except Exception as e:
         return jsonify({"error": f"Error fetching bird questions: {str(e)}"}), 500
 
 
+@app.route("/chat-cache/stats", methods=["GET"])
+@login_required
+def get_chat_cache_stats():
+    """Answer cache size and hit rate for this process (admin only)."""
+    if not is_admin(session["user_id"]):
+        return jsonify({"error": "Forbidden"}), 403
+    return jsonify(answer_cache.stats()), 200
+
+
+@app.route("/chat-cache/prewarm", methods=["POST"])
+@login_required
+def prewarm_chat_cache():
+    """Fetch answers for the suggested questions in the background (admin only)."""
+    if not is_admin(session["user_id"]):
+        return jsonify({"error": "Forbidden"}), 403
+    threading.Thread(target=answer_cache.prewarm, args=(get_openai_client(), BIRD_QUESTIONS), daemon=True).start()
+    return jsonify({"message": "Prewarming answer cache", "questions": len(BIRD_QUESTIONS)}), 202
 
 
-def haversine_distance(lat1, lon1, lat2, lon2):
-    """
-    Calculate distance in KM between two lat/lon points using Haversine.
-    We'll convert to miles below if we want that.
-    """
-    R = 6371.0  # Earth radius in km
-    d_lat = math.radians(lat2 - lat1)
-    d_lon = math.radians(lon2 - lon1)
-    a = (math.sin(d_lat / 2) ** 2 +
-         math.cos(math.radians(lat1)) *
-         math.cos(math.radians(lat2)) *
-         math.sin(d_lon / 2) ** 2)
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    return R * c
 
 
 @app.route("/get-hotspot", methods=["GET"])
@@ -883,38 +1174,94 @@ def get_hotspot():
 
     user_lat = request.args.get("lat", type=float)
     user_lon = request.args.get("lon", type=float)
+    k = request.args.get("k", type=int)
 
-    doc_ref = (
-        db.collection("forecasts")
-          .document(bird)
-          .collection("topHotspots")
-          .document(str(month))
-          .get()
-    )
-    if not doc_ref.exists:
+    forecast = get_forecast(db, bird, month)
+    if forecast is None:
         return jsonify({"error": "No precomputed topHotspots for this bird/month"}), 404
 
-    data = doc_ref.to_dict()  
-
-    if "topHotspots" not in data or not data["topHotspots"]:
+    if not forecast.hotspots:
         return jsonify({"error": "No hotspots found"}), 404
 
-    hotspots = data["topHotspots"]  
+    hotspots, lats, lons, scores = forecast.hotspots, forecast.lats, forecast.lons, forecast.scores
 
-    if user_lat is not None and user_lon is not None:
-        for h in hotspots:
-            dist_km = haversine_distance(user_lat, user_lon, h["lat"], h["lon"])
-            dist_mi = dist_km * 0.621371
-            h["distance_miles"] = dist_mi
+    # Without k, keep returning the single best hotspot as before
+    if k is None:
+        best_hotspot = top_hotspots(hotspots, lats, lons, scores, user_lat, user_lon, k=1)[0]
+        return jsonify(best_hotspot), 200
 
-        hotspots.sort(key=lambda x: (x["distance_miles"], -x["reliability_score"]))
+    k = max(1, min(k, MAX_HOTSPOTS))
+    return jsonify({"hotspots": top_hotspots(hotspots, lats, lons, scores, user_lat, user_lon, k=k)}), 200
 
-        best_hotspot = hotspots[0]
-    else:
-        hotspots.sort(key=lambda x: x["reliability_score"], reverse=True)
-        best_hotspot = hotspots[0]
 
-    return jsonify(best_hotspot), 200
+@app.route("/nearby", methods=["GET"])
+@login_required
+def get_nearby():
+    """
+    Species detected recently within a radius of the user (kind=detections),
+    or hotspots for a bird/month within the radius (kind=hotspots).
+    """
+    user_lat = request.args.get("lat", type=float)
+    user_lon = request.args.get("lon", type=float)
+    if user_lat is None or user_lon is None:
+        return jsonify({"error": "lat and lon are required"}), 400
+
+    radius = min(request.args.get("radius", 20.0, type=float), MAX_NEARBY_MILES)
+    kind = request.args.get("kind", "detections")
+
+    try:
+        if kind == "hotspots":
+            bird = request.args.get("bird", "robins")
+            month = request.args.get("month", datetime.now().month, type=int)
+            k = max(1, min(request.args.get("k", MAX_HOTSPOTS, type=int), MAX_HOTSPOTS))
+
+            forecast = get_forecast(db, bird, month)
+            if forecast is None:
+                return jsonify({"error": "No precomputed topHotspots for this bird/month"}), 404
+            nearby = hotspots_within(forecast.hotspots, forecast.lats, forecast.lons, user_lat, user_lon, radius, k)
+            return jsonify({"radius_miles": radius, "hotspots": nearby}), 200
+
+        if kind != "detections":
+            return jsonify({"error": "kind must be detections or hotspots"}), 400
+
+        days = min(request.args.get("days", 7, type=int), detection_feed.window.days)
+        since = datetime.now(timezone('UTC')) - timedelta(days=days)
+        detection_feed.ensure_started(db)
+
+        species = {}
+        for dist, detection in detection_feed.query_radius(user_lat, user_lon, radius, since=since):
+            entry = species.get(detection["bird"])
+            if entry is None:
+                species[detection["bird"]] = {
+                    "bird": detection["bird"],
+                    "count": 1,
+                    "nearest_miles": dist,
+                    "lastSeen": detection["timestamp"]
+                }
+            else:
+                entry["count"] += 1
+                entry["lastSeen"] = max(entry["lastSeen"], detection["timestamp"])
+
+        return jsonify({
+            "radius_miles": radius,
+            "days": days,
+            "species": sorted(species.values(), key=lambda x: (-x["count"], x["nearest_miles"]))
+        }), 200
+    except Exception as e:
+        return jsonify({"error": f"Error running nearby query: {str(e)}"}), 500
+
+
+@app.route("/forecasts/invalidate", methods=["POST"])
+@login_required
+def invalidate_forecast_cache():
+    """Drop cached forecasts after they are regenerated (admin only)."""
+    if not is_admin(session["user_id"]):
+        return jsonify({"error": "Forbidden"}), 403
+    try:
+        bump_forecast_version(db)
+        return jsonify({"message": "Forecast cache invalidated"}), 200
+    except Exception as e:
+        return jsonify({"error": f"Error invalidating forecasts: {str(e)}"}), 500
 
 
 
@@ -943,11 +1290,33 @@ def delete_user(user_id):
         auth.delete_user(user_id)
         db.collection("users").document(user_id).delete()
         session.pop("user_id", None)
-        return jsonify({"message": "Account deleted"}), 200
+        # Detections, chats and the summary are purged in the background
+        job_id = deletion_worker.submit("user", user_id, user_id)
+        return jsonify({"message": "Account deleted", "jobId": job_id}), 202
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
 
+@app.route('/deletion-jobs/<job_id>', methods=['GET'])
+@login_required
+def get_deletion_job(job_id):
+    """Progress of one of the user's background chat or account deletions."""
+    try:
+        job = deletion_worker.get_job(job_id)
+        # Someone else's job looks the same as a missing one
+        if job is None or job.get("userId") != session["user_id"]:
+            return jsonify({"error": "Job not found"}), 404
+        return jsonify({
+            "jobId": job_id,
+            "kind": job.get("kind"),
+            "status": job.get("status"),
+            "deleted": job.get("deleted", 0),
+            "error": job.get("error")
+        }), 200
+    except Exception as e:
+        return jsonify({"error": f"Error fetching deletion job: {str(e)}"}), 500
+
+
 @app.route('/users/me', methods=['GET'])
 @login_required
 def get_my_user():
@@ -968,5 +1337,26 @@ def get_my_user():
 
 
 
+def start_background_services():
+    """Start per-process background threads. Under gunicorn this runs in each worker after fork."""
+    start_warmup()
+    start_session_sweeper(db)
+    deletion_worker.start()
+    start_metrics_writer()
+    if os.getenv("CHAT_CACHE_PREWARM", "").lower() in ("1", "true", "yes"):
+        threading.Thread(target=answer_cache.prewarm, args=(get_openai_client(), BIRD_QUESTIONS), daemon=True).start()
+
+
+if os.getenv("ROBIN_PREFORK") == "1":
+    # Load BirdNET in the master (when preloading) so workers inherit it
+    if BIRDNET_WARMUP == "sync":
+        start_warmup()
+else:
+    start_background_services()
+
+mark_started("server_import")
+print(f"Startup timings (s): {json.dumps(startup_report()['phases'])}")
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000)
\ No newline at end of file
@@ -0,0 +1,198 @@
+import os
+import time
+import random
+import hashlib
+import secrets
+import threading
+from datetime import datetime, timedelta, timezone
+from cachetools import TTLCache
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+from google.cloud.firestore_v1.field_path import FieldPath
+
+# signed: Flask's signed cookie holds the session, verified in memory with FLASK_SECRET_KEY (default)
+# firestore: the cookie holds an opaque id; sessions live in Firestore and can be revoked
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "signed").lower()
+SESSION_COLLECTION = "sessions"
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", 10000))
+# Bounds how long a logout or revocation on another instance goes unnoticed here
+SESSION_CACHE_TTL = int(os.getenv("SESSION_CACHE_TTL", 60))
+# Sliding expiry is pushed back at most this often, so active users don't cost a write per request
+SESSION_REFRESH_SECONDS = int(os.getenv("SESSION_REFRESH_SECONDS", 24 * 60 * 60))
+SESSION_SWEEP_INTERVAL = int(os.getenv("SESSION_SWEEP_INTERVAL", 60 * 60))
+SWEEP_BATCH_SIZE = 400
+
+_sweeper = None
+_sweeper_lock = threading.Lock()
+
+
+class StoredSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, expires_at=None):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.new = sid is None
+        self.opened_user = (initial or {}).get("user_id")
+        self.modified = False
+
+
+def _doc_id(sid):
+    # Only a hash of the id is stored, so reading the collection doesn't hand out live sessions
+    return hashlib.sha256(sid.encode("utf-8")).hexdigest()
+
+
+class FirestoreSessionInterface(SessionInterface):
+    """
+    Sessions stored in the `sessions` collection, shared by every instance,
+    with a short-lived in-process cache in front so most requests check the
+    cookie without a Firestore read. The document is written only when the
+    session changes or its expiry needs pushing back.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._cache = TTLCache(maxsize=SESSION_CACHE_SIZE, ttl=SESSION_CACHE_TTL)
+        self._lock = threading.Lock()
+
+    def _ref(self, sid):
+        return self.db.collection(SESSION_COLLECTION).document(_doc_id(sid))
+
+    def _load(self, sid):
+        with self._lock:
+            cached = self._cache.get(sid)
+        if cached is not None:
+            return cached
+
+        snapshot = self._ref(sid).get()
+        record = snapshot.to_dict() if snapshot.exists else None
+        cached = (record["data"], record["expiresAt"]) if record else (None, None)
+        with self._lock:
+            self._cache[sid] = cached
+        return cached
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if not sid:
+            return StoredSession()
+        data, expires_at = self._load(sid)
+        if data is None or expires_at <= datetime.now(timezone.utc):
+            return StoredSession()
+        return StoredSession(dict(data), sid=sid, expires_at=expires_at)
+
+    def _forget(self, sid):
+        self._ref(sid).delete()
+        with self._lock:
+            self._cache.pop(sid, None)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session.keys() - {"_permanent"}:
+            # Nothing worth storing, or emptied on logout
+            if session.sid is not None and session.modified:
+                self._forget(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        now = datetime.now(timezone.utc)
+        lifetime = app.permanent_session_lifetime
+        stale = session.expires_at is None or session.expires_at - now < lifetime - timedelta(seconds=SESSION_REFRESH_SECONDS)
+        if not session.modified and not stale:
+            return
+
+        # A new login always gets a new id
+        if session.sid is not None and session.get("user_id") != session.opened_user:
+            self._forget(session.sid)
+            session.sid = None
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(32)
+
+        data = dict(session)
+        expires_at = now + lifetime
+        self._ref(session.sid).set({
+            "data": data,
+            "userId": data.get("user_id"),
+            "expiresAt": expires_at,
+            "updatedAt": now
+        })
+        with self._lock:
+            self._cache[session.sid] = (data, expires_at)
+
+        response.set_cookie(
+            name, session.sid, expires=expires_at, domain=domain, path=path,
+            httponly=self.get_cookie_httponly(app), secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app)
+        )
+
+
+def configure_sessions(app, db):
+    """Install the session backend chosen by SESSION_BACKEND."""
+    if SESSION_BACKEND == "firestore":
+        app.session_interface = FirestoreSessionInterface(db)
+    elif SESSION_BACKEND != "signed":
+        raise ValueError(f"Unknown SESSION_BACKEND: {SESSION_BACKEND}")
+    return app.session_interface
+
+
+def sweep_expired_sessions(db, batch_size=SWEEP_BATCH_SIZE):
+    """Delete stored sessions past their expiry, one batch at a time; returns how many were removed."""
+    query = (
+        db.collection(SESSION_COLLECTION)
+          .where("expiresAt", "<", datetime.now(timezone.utc))
+          .select([FieldPath.document_id()])
+          .limit(batch_size)
+    )
+    removed = 0
+    while True:
+        docs = list(query.stream())
+        if not docs:
+            return removed
+        batch = db.batch()
+        for doc in docs:
+            batch.delete(doc.reference)
+        batch.commit()
+        removed += len(docs)
+
+
+def _sweep_forever(db):
+    # Jittered so instances started together don't all sweep at once
+    time.sleep(random.uniform(0, SESSION_SWEEP_INTERVAL))
+    while True:
+        try:
+            removed = sweep_expired_sessions(db)
+            if removed:
+                print(f"Removed {removed} expired sessions")
+        except Exception as e:
+            print(f"Error sweeping sessions: {str(e)}")
+        time.sleep(SESSION_SWEEP_INTERVAL)
+
+
+def start_session_sweeper(db):
+    """Sweep expired sessions every SESSION_SWEEP_INTERVAL seconds on a background thread (Firestore backend only)."""
+    global _sweeper
+    if SESSION_BACKEND != "firestore":
+        return
+    with _sweeper_lock:
+        if _sweeper is None:
+            _sweeper = threading.Thread(target=_sweep_forever, args=(db,), name="session-sweeper", daemon=True)
+            _sweeper.start()
+
+
+if __name__ == "__main__":
+    import argparse
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Delete expired sessions from Firestore.")
+    parser.parse_args()
+
+    SERVICE_ACCOUNT_FILE = os.getenv("FIREBASE_ADMIN_CREDENTIALS", "backend/secrets/firebase-admin-key.json")
+    firebase_admin.initialize_app(credentials.Certificate(SERVICE_ACCOUNT_FILE))
+    print(f"Removed {sweep_expired_sessions(firestore.client())} expired sessions")
@@ -0,0 +1,125 @@
+import math
+import threading
+import numpy as np
+from hotspots import haversine_distances, KM_TO_MILES
+
+MILES_PER_DEGREE_LAT = 69.0
+MAX_SEARCH_MILES = 12500.0
+
+
+class GridIndex:
+    """
+    Points bucketed into fixed-size lat/lon cells (a geohash-style grid).
+    Radius queries only look at cells overlapping the search area, then
+    filter the candidates with a vectorised haversine. Points can be added
+    and removed at any time.
+    """
+
+    def __init__(self, cell_degrees=0.25):
+        self.cell_degrees = cell_degrees
+        self._lon_cells = int(round(360 / cell_degrees))
+        self._lat_cells = int(round(180 / cell_degrees))
+        self._cells = {}
+        self._item_cells = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._item_cells)
+
+    def __contains__(self, item_id):
+        with self._lock:
+            return item_id in self._item_cells
+
+    def _cell(self, lat, lon):
+        row = min(max(int(math.floor((lat + 90) / self.cell_degrees)), 0), self._lat_cells - 1)
+        col = int(math.floor((lon + 180) / self.cell_degrees)) % self._lon_cells
+        return row, col
+
+    def add(self, item_id, lat, lon, payload):
+        """Insert or move a point."""
+        cell = self._cell(lat, lon)
+        with self._lock:
+            self.remove(item_id)
+            self._cells.setdefault(cell, {})[item_id] = (lat, lon, payload)
+            self._item_cells[item_id] = cell
+
+    def remove(self, item_id):
+        with self._lock:
+            cell = self._item_cells.pop(item_id, None)
+            if cell is None:
+                return
+            bucket = self._cells[cell]
+            bucket.pop(item_id, None)
+            if not bucket:
+                del self._cells[cell]
+
+    def remove_where(self, predicate):
+        """Drop every point whose payload matches `predicate`; returns how many went."""
+        with self._lock:
+            doomed = [
+                item_id
+                for bucket in self._cells.values()
+                for item_id, (_, _, payload) in bucket.items()
+                if predicate(payload)
+            ]
+            for item_id in doomed:
+                self.remove(item_id)
+        return len(doomed)
+
+    def _candidate_cells(self, lat, lon, radius_miles):
+        lat_span = radius_miles / MILES_PER_DEGREE_LAT
+        lat_lo, lat_hi = max(lat - lat_span, -90.0), min(lat + lat_span, 90.0)
+        row_lo, _ = self._cell(lat_lo, lon)
+        row_hi, _ = self._cell(lat_hi, lon)
+
+        widest = math.cos(math.radians(max(abs(lat_lo), abs(lat_hi))))
+        lon_span = lat_span / widest if widest > 1e-6 else 360.0
+        if lon_span >= 180:
+            cols = None
+        else:
+            _, col_lo = self._cell(lat, lon - lon_span)
+            _, col_hi = self._cell(lat, lon + lon_span)
+            if col_lo <= col_hi:
+                cols = set(range(col_lo, col_hi + 1))
+            else:
+                cols = set(range(col_lo, self._lon_cells)) | set(range(0, col_hi + 1))
+
+        with self._lock:
+            # For wide searches it's cheaper to walk the occupied cells than the range
+            if cols is None or (row_hi - row_lo + 1) * len(cols) > len(self._cells):
+                return [
+                    bucket for (row, col), bucket in self._cells.items()
+                    if row_lo <= row <= row_hi and (cols is None or col in cols)
+                ]
+            return [
+                self._cells[(row, col)]
+                for row in range(row_lo, row_hi + 1)
+                for col in cols
+                if (row, col) in self._cells
+            ]
+
+    def query_radius(self, lat, lon, radius_miles):
+        """Return (distance_miles, payload) pairs within the radius, nearest first."""
+        with self._lock:
+            points = [point for bucket in self._candidate_cells(lat, lon, radius_miles) for point in bucket.values()]
+        if not points:
+            return []
+
+        lats = np.fromiter((p[0] for p in points), dtype=np.float64, count=len(points))
+        lons = np.fromiter((p[1] for p in points), dtype=np.float64, count=len(points))
+        distances = haversine_distances(lat, lon, lats, lons) * KM_TO_MILES
+        inside = np.flatnonzero(distances <= radius_miles)
+        inside = inside[np.argsort(distances[inside], kind="stable")]
+        return [(float(distances[i]), points[i][2]) for i in inside]
+
+    def nearest(self, lat, lon, k, max_radius_miles=MAX_SEARCH_MILES):
+        """Return the k nearest (distance_miles, payload) pairs by widening the search ring."""
+        if k < 1:
+            return []
+        radius = self.cell_degrees * MILES_PER_DEGREE_LAT
+        while True:
+            found = self.query_radius(lat, lon, radius)
+            if len(found) >= k or radius >= max_radius_miles:
+                return found[:k]
+            radius = min(radius * 2, max_radius_miles)
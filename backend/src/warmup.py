@@ -0,0 +1,105 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+# background: load BirdNET on a thread at startup (default)
+# sync: load it before the server finishes importing
+# off: load it on the first request that needs it
+BIRDNET_WARMUP = os.getenv("BIRDNET_WARMUP", "background").lower()
+
+STARTUP_TIMINGS = {}
+_started = time.perf_counter()
+
+_analyzer = None
+_analyzer_lock = threading.Lock()
+# The TFLite interpreter behind the analyzer isn't safe to run from two threads at once
+analysis_lock = threading.Lock()
+_loaded = threading.Event()
+_warmup_thread = None
+_warmup_error = None
+
+
+@contextmanager
+def timed_phase(name):
+    """Record how long a startup phase took, in seconds."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STARTUP_TIMINGS[name] = round(time.perf_counter() - start, 3)
+
+
+def get_analyzer():
+    """The shared BirdNET analyzer, imported and loaded on first use."""
+    global _analyzer
+    if _analyzer is not None:
+        return _analyzer
+    with _analyzer_lock:
+        if _analyzer is None:
+            with timed_phase("birdnet_import"):
+                from birdnetlib.analyzer import Analyzer
+            logging.getLogger("birdnetlib").setLevel(logging.ERROR)
+            with timed_phase("birdnet_model_load"):
+                analyzer = Analyzer()
+                analyzer.verbose = False
+            _analyzer = analyzer
+            _loaded.set()
+    return _analyzer
+
+
+def _warm_up():
+    global _warmup_error
+    try:
+        get_analyzer()
+    except Exception as e:
+        _warmup_error = str(e)
+        print(f"BirdNET warm-up failed: {str(e)}")
+
+
+def start_warmup():
+    """Begin loading BirdNET according to BIRDNET_WARMUP."""
+    global _warmup_thread
+    if BIRDNET_WARMUP == "off":
+        return
+    if BIRDNET_WARMUP == "sync":
+        _warm_up()
+        return
+    if _warmup_thread is None:
+        _warmup_thread = threading.Thread(target=_warm_up, name="birdnet-warmup", daemon=True)
+        _warmup_thread.start()
+
+
+def is_ready():
+    """True once BirdNET is loaded, or always when warm-up is turned off."""
+    return BIRDNET_WARMUP == "off" or _loaded.is_set()
+
+
+def mark_started(name="server_import"):
+    """Record the time from the first import of this module until now."""
+    STARTUP_TIMINGS[name] = round(time.perf_counter() - _started, 3)
+
+
+def startup_report():
+    return {
+        "ready": is_ready(),
+        "birdnetLoaded": _loaded.is_set(),
+        "warmup": BIRDNET_WARMUP,
+        "error": _warmup_error,
+        "phases": dict(STARTUP_TIMINGS),
+    }
+
+
+if __name__ == "__main__":
+    # Import the server the way a worker would and print where startup time went
+    import json
+    import importlib
+
+    started = time.perf_counter()
+    importlib.import_module("server")
+    tracked = importlib.import_module("warmup")
+    if tracked._warmup_thread is not None:
+        tracked._warmup_thread.join(600)
+    tracked.STARTUP_TIMINGS["ready"] = round(time.perf_counter() - started, 3)
+    print(json.dumps(tracked.startup_report(), indent=2))
@@ -0,0 +1,79 @@
+import random
+from datetime import datetime, timedelta, timezone
+from forecast_pipeline import _empty_grid, _cell_doc, _cell_from_doc, fold_page, rank_cells, top_cells
+
+CREATED = datetime(2024, 6, 1, tzinfo=timezone.utc)
+CELL_A = (42.35, -83.05)
+CELL_B = (43.35, -84.05)
+
+
+def detection(day, cell, bird="American Robin"):
+    lat, lon = cell
+    return {
+        "bird": bird,
+        "latitude": lat,
+        "longitude": lon,
+        "timestamp": datetime(2024, 5, day, 16, tzinfo=timezone.utc),
+        "createdAt": CREATED,
+    }
+
+
+def fold(pages):
+    grids = {}
+    for rows in pages:
+        fold_page(rows, grids, lambda key, month, bird: _empty_grid(bird), lambda key, month, cell_ids: {})
+    return grids[("robin", 5)]
+
+
+def test_days_counted_when_pages_arrive_out_of_day_order():
+    grid = fold([[detection(20, CELL_A)], [detection(3, CELL_B)], [detection(4, CELL_B)], [detection(5, CELL_B)]])
+
+    assert len(grid["days"]) == 4
+    scores = {(h["days"], h["detections"]): h["reliability_score"] for h in rank_cells(grid)}
+    assert scores == {(3, 3): 0.75, (1, 1): 0.25}
+
+
+def test_repeated_days_counted_once():
+    grid = fold([[detection(5, CELL_A), detection(5, CELL_B)], [detection(5, CELL_A)], [detection(4, CELL_A)]])
+
+    assert len(grid["days"]) == 2
+    hotspots = rank_cells(grid)
+    assert [(h["days"], h["detections"], h["reliability_score"]) for h in hotspots] == [(2, 3, 1.0), (1, 1, 0.5)]
+
+
+def test_scores_never_exceed_one():
+    days = [28, 1, 15, 2, 30, 3]
+    grid = fold([[detection(day, CELL_A if i % 2 else CELL_B)] for i, day in enumerate(days)])
+
+    assert all(0 < h["reliability_score"] <= 1 for h in rank_cells(grid))
+
+
+def test_incremental_runs_rank_like_one_pass():
+    rng = random.Random(0)
+    rows = [
+        {**detection(rng.randrange(1, 29), (42 + rng.random(), -83 - rng.random())), "createdAt": CREATED + timedelta(seconds=i)}
+        for i in range(2000)
+    ]
+    one_pass = fold([rows])
+
+    # Each run stores only the cells it touched plus the grid's days and top cell ids, as run_pipeline does
+    stored_cells, stored_grid = {}, None
+    for run in (rows[:800], rows[800:1500], rows[1500:]):
+        def load_cells(key, month, cell_ids):
+            return {cell_id: _cell_from_doc(stored_cells[cell_id]) for cell_id in cell_ids if cell_id in stored_cells}
+
+        def load_grid(key, month, bird):
+            grid = _empty_grid(bird)
+            if stored_grid is not None:
+                grid["days"] = set(stored_grid["days"])
+                grid["cells"] = load_cells(key, month, stored_grid["top"])
+            return grid
+
+        grids = {}
+        for start in range(0, len(run), 300):
+            fold_page(run[start:start + 300], grids, load_grid, load_cells)
+        grid = grids[("robin", 5)]
+        stored_cells.update({cell_id: _cell_doc(grid["cells"][cell_id]) for cell_id in grid["touched"]})
+        stored_grid = {"days": grid["days"], "top": [cell_id for cell_id, _ in top_cells(grid)]}
+
+    assert [(h["days"], h["detections"]) for h in rank_cells(grid)] == [(h["days"], h["detections"]) for h in rank_cells(one_pass)]
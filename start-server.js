@@ -44,9 +44,9 @@ function startProcesses() {
     console.log("Starting Backend Server...");
     const backendProcess = spawn(`"${pythonBinary}"`, ["backend/src/server.py"], { stdio: "inherit", shell: isWindows });
 
-    // Start Bird Detection Script
-    console.log("Starting Bird Detection Script...");
-    const detectProcess = spawn(`"${pythonBinary}"`, ["backend/src/detect_birds.py"], { stdio: "inherit", shell: isWindows });
+    // Start Bird Detection Service (idle until detection is started from the app)
+    console.log("Starting Bird Detection Service...");
+    const detectProcess = spawn(`"${pythonBinary}"`, ["backend/src/detection_service.py"], { stdio: "inherit", shell: isWindows });
 
     // Start Expo Frontend
     console.log("Starting Expo Frontend...");